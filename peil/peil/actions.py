@@ -3,8 +3,10 @@ from django.contrib import messages
 
 def create_pvts(modeladmin, request, queryset):
     '''Create pvty messages from ubx file '''
+    count = 0
     for u in queryset:
-        u.create_pvts()
+        count += u.create_pvts()
+    messages.success(request, '{} NAV-PVT messages added'.format(count))
 create_pvts.short_description='UBX-NAV-PVT messages aanmaken'
 
 def calcseries(modeladmin, request, queryset):
@@ -18,45 +20,28 @@ calcseries.short_description='Tijdreeksen  berekenen'
 def to_orion(modeladmin, request, queryset):
     from peil.fiware import Orion
     orion = Orion(settings.ORION_URL)
+    devices = list(queryset)
     errors = 0
-    created = 0
-    for dev in queryset:
-        response = orion.create_device(dev)
-        if response.ok:
-            created += 1
-        else:
-            messages.error(request,response.json())
+    for response in orion.create_devices(devices):
+        if not response.ok:
+            messages.error(request,response.text)
             errors += 1
     if not errors:
-        messages.success(request,'{} Orion entities created'.format(created))
+        messages.success(request,'{} Orion entities created'.format(len(devices)))
 to_orion.short_description = 'Orion entities aanmaken'
         
 def rtkpost(modeladmin, request, queryset):
-    ''' Run postprocessing for ubx files '''
-    success = 0
-    fail = 0
-    for u in queryset:
-        sol = u.post()
-        if sol:
-            success += 1
-        else:
-            fail += 1
-    if success == 1:
-        messages.success(request, '{} processed successfully'.format(u))
-    elif success > 1:
-        messages.success(request, '{} files processed successfully'.format(success))
-    if fail == 1:
-        messages.error(request, 'processing failed for {}'.format(u))
-    elif fail > 1:
-        messages.error(request, 'processing failed for {} files'.format(fail))
-    
+    ''' Queue postprocessing for ubx files '''
+    from peil.postproc import queue
+    count = queue(queryset)
+    messages.success(request, '{} files queued for postprocessing'.format(count))
 rtkpost.short_description='Postprocessing uitvoeren'
 
 def postdevice(modeladmin, request, queryset):
-    ''' Run postprocessing for devices using most recent ubxfile '''
-    for d in queryset:
-        ubx = d.ubxfile_set.latest('start')
-        ubx.post()
+    ''' Queue postprocessing for devices using most recent ubxfile '''
+    from peil.postproc import queue
+    count = queue(d.ubxfile_set.latest('start') for d in queryset if d.ubxfile_set.exists())
+    messages.success(request, '{} files queued for postprocessing'.format(count))
 postdevice.short_description='Postprocessing uitvoeren'
 
 def gpson(modeladmin, request, queryset):
@@ -3,7 +3,7 @@ from peil.models import Device, Sensor,\
     UBXFile, ECSensor, PressureSensor,\
     BatterySensor, AngleSensor, LoraMessage, ECMessage, PressureMessage,\
     InclinationMessage, StatusMessage, LocationMessage, GNSS_Sensor, Survey,\
-    Photo, NavPVT, RTKSolution
+    Photo, NavPVT, RTKSolution, Latest, Rollup, OrionUpdate, Uplink, PendingUplink
 from peil.actions import create_pvts, rtkpost, gpson, postdevice, to_orion
 from peil.sensor import create_sensors, load_offsets,\
     load_distance, load_survey
@@ -136,6 +136,43 @@ class PhotoAdmin(AdminImageMixin, admin.ModelAdmin):
                 })
     thumb.allow_tags = True
 
+@admin.register(Latest)
+class LatestAdmin(admin.ModelAdmin):
+    model = Latest
+    list_display = ('sensor', 'time', 'value', 'fields')
+    list_filter = ('sensor__device', 'sensor__ident')
+    list_select_related = ('sensor',)
+
+@admin.register(Rollup)
+class RollupAdmin(admin.ModelAdmin):
+    model = Rollup
+    list_display = ('sensor', 'interval', 'time', 'count', 'mean', 'min', 'max')
+    list_filter = ('interval', 'sensor__device', 'sensor__ident', 'time')
+    list_select_related = ('sensor',)
+
+@admin.register(OrionUpdate)
+class OrionUpdateAdmin(admin.ModelAdmin):
+    model = OrionUpdate
+    list_display = ('entity_id', 'entity_type', 'created', 'attempts', 'claimed', 'next_attempt', 'error')
+    list_filter = ('entity_type', 'attempts')
+    search_fields = ('entity_id',)
+
+@admin.register(Uplink)
+class UplinkAdmin(admin.ModelAdmin):
+    model = Uplink
+    list_display = ('received', 'source', 'serial')
+    list_filter = ('source', 'received')
+    search_fields = ('serial',)
+    exclude = ('body',)
+
+@admin.register(PendingUplink)
+class PendingUplinkAdmin(admin.ModelAdmin):
+    model = PendingUplink
+    list_display = ('uplink', 'attempts', 'next_attempt', 'dead', 'error')
+    list_filter = ('dead',)
+    list_select_related = ('uplink',)
+    raw_id_fields = ('uplink',)
+
 @admin.register(RTKSolution)
 class RTKAdmin(admin.ModelAdmin):
     model = RTKSolution
@@ -152,8 +189,9 @@ class RTKInline(admin.TabularInline):
 class UBXFileAdmin(admin.ModelAdmin):
     model = UBXFile
     actions = [create_pvts, rtkpost]
-    list_filter = ('device','start')
-    list_display = ('__unicode__','device','start', 'stop','solution_count','solution_stats')
+    list_filter = ('device','start','status')
+    list_display = ('__unicode__','device','start', 'stop','solution_count','solution_stats','status','post_duration')
+    readonly_fields = ('offset','status','queued','started','finished','error')
     #inlines = [RTKInline]
     
 @admin.register(NavPVT)
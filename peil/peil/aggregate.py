@@ -0,0 +1,114 @@
+'''
+Created on Oct 18, 2026
+
+Aggregation of sensor messages per time bucket in the database
+'''
+from django.db.models import Avg, Min, Max, Count, Case, When, F, FloatField, DateTimeField, Func
+from django.db.models.functions import Trunc
+import pandas as pd
+import pytz
+
+# buckets that are supported by date_trunc
+TRUNC_KINDS = ('minute', 'hour', 'day', 'week', 'month', 'year')
+
+STATISTICS = {
+    'mean': Avg,
+    'min': Min,
+    'max': Max,
+    'count': Count
+    }
+
+class EpochBucket(Func):
+    ''' start of fixed size time bucket, counted in seconds since 1970-01-01 '''
+    template = 'to_timestamp(floor(extract(epoch from %(expressions)s) / %(seconds)d) * %(seconds)d)'
+
+    def __init__(self, expression, seconds, **extra):
+        super(EpochBucket, self).__init__(expression, seconds=int(seconds), output_field=DateTimeField(), **extra)
+
+def bucket(interval, field='time'):
+    """
+    @summary: returns expression for start of time bucket
+    @param interval: one of TRUNC_KINDS, number of seconds or a pandas offset like '15min' or '6H'
+    """
+    if interval in TRUNC_KINDS:
+        return Trunc(field, interval, output_field=DateTimeField(), tzinfo=pytz.utc)
+    if isinstance(interval, basestring):
+        interval = pd.to_timedelta(interval).total_seconds()
+    return EpochBucket(field, interval)
+
+def aggregate(sensors, fields=None, interval='hour', start=None, stop=None, stats=('mean','min','max','count'), limit=None):
+    """
+    @summary: aggregate raw message values per sensor and time bucket
+    @param sensors: list of sensors of the same type
+    @param fields: names of message fields to aggregate (default all raw fields)
+    @param interval: size of time bucket (see bucket())
+    @param start: optional start time (inclusive)
+    @param stop: optional stop time (exclusive)
+    @param stats: statistics to calculate
+    @param limit: when given, values equal to or above limit are ignored
+    @return: Pandas dataframe with columns sensor_id, time and <field>_<stat> for every field and statistic
+    """
+    sensors = list(sensors)
+    model = sensors[0].message_model()
+    if fields is None:
+        fields = model.data_fields()
+    query = model.objects.non_polymorphic().filter(sensor_id__in=[s.pk for s in sensors])
+    if start:
+        query = query.filter(time__gte=start)
+    if stop:
+        query = query.filter(time__lt=stop)
+
+    aggregates = {}
+    for field in fields:
+        if limit is None:
+            value = F(field)
+        else:
+            value = Case(When(then=F(field), **{field+'__lt': limit}), output_field=FloatField())
+        for stat in stats:
+            aggregates['{}_{}'.format(field,stat)] = STATISTICS[stat](value)
+
+    rows = query.annotate(bucket=bucket(interval)).values('sensor_id','bucket').annotate(**aggregates).order_by('sensor_id','bucket')
+    df = pd.DataFrame.from_records(list(rows), columns=['sensor_id','bucket'] + sorted(aggregates.keys()))
+    df['bucket'] = pd.to_datetime(df['bucket'], utc=True)
+    return df.rename(columns={'bucket': 'time'})
+
+def raw_series(sensor, interval='hour', start=None, stop=None, limit=4096):
+    """ returns Pandas dataframe indexed on time with mean of raw values per time bucket, ignoring values at or above limit """
+    df = aggregate([sensor], interval=interval, start=start, stop=stop, stats=('mean',), limit=limit)
+    df = df.drop('sensor_id', axis=1).set_index('time')
+    return df.rename(columns=lambda name: name[:-len('_mean')])
+
+# pandas resample rules matching the buckets of date_trunc
+RESAMPLE_RULES = {
+    'minute': 'T',
+    'hour': 'H',
+    'day': 'D',
+    'week': 'W-MON',
+    'month': 'MS',
+    'year': 'AS'
+    }
+
+def resample_rule(interval):
+    """ returns pandas resample rule for time bucket (see bucket()) """
+    if interval in RESAMPLE_RULES:
+        return RESAMPLE_RULES[interval]
+    if isinstance(interval, basestring):
+        interval = pd.to_timedelta(interval).total_seconds()
+    return '{}S'.format(int(interval))
+
+def calibrated_series(sensor, interval='hour', start=None, stop=None):
+    """ returns Pandas series with the mean of the calibrated values per time bucket. Empty buckets are NaN.
+        Linear calibrations (see Sensor.linear) are applied to the mean of the raw values aggregated in the database.
+        Other sensors are calibrated message by message, so values outside the calibration limits are ignored.
+        With USE_ROLLUPS, get_sensor_series reads hourly rollups and uses this only for the period before the rollups start
+    """
+    linear = sensor.linear()
+    if linear is None:
+        series = sensor.series(start, stop)
+    else:
+        field, offset, scale = linear
+        df = aggregate([sensor], [field], interval, start, stop, stats=('mean',), limit=sensor.adc_limit)
+        series = pd.Series((offset + df[field+'_mean'].astype(float) * scale).values, index=pd.DatetimeIndex(df['time']), dtype=float)
+    if series.empty:
+        return series
+    return series.resample(resample_rule(interval), closed='left', label='left').mean()
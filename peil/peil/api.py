@@ -10,7 +10,7 @@ from tastypie import fields
 from tastypie.authentication import BasicAuthentication
 
 from .models import Device
-from peil.models import Sensor, LoraMessage, StatusMessage
+from peil.models import Sensor, LoraMessage, StatusMessage, Rollup
 
 class DeviceResource(ModelResource): 
 
@@ -44,7 +44,7 @@ class SensorResource(ModelResource):
         return bundle
     
     class Meta:
-        queryset = Sensor.objects.all()
+        queryset = Sensor.objects.select_related('latest')
         resource_name = 'sensor'
         authentication = BasicAuthentication(realm='Acacia Water')
         authorization = DjangoAuthorization()
@@ -86,3 +86,22 @@ class BatteryResource(MessageResource):
             'battery': ALL
             }
     
+
+class RollupResource(ModelResource): 
+    sensor = fields.ForeignKey(SensorResource,'sensor')
+
+    def dehydrate(self, bundle):
+        if bundle.obj:
+            bundle.data['raw'] = bundle.obj.raw_stats()
+        return bundle
+    
+    class Meta:
+        queryset = Rollup.objects.order_by('-time')
+        resource_name = 'rollup'
+        authentication = BasicAuthentication(realm='Acacia Water')
+        authorization = DjangoAuthorization()
+        filtering = {
+            'sensor': ALL_WITH_RELATIONS,
+            'interval': ALL,
+            'time': ALL
+            }
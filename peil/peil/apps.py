@@ -16,3 +16,6 @@ class PeilConfig(AppConfig):
         # auto create api keys
         from tastypie.models import create_api_key
         signals.post_save.connect(create_api_key, sender='auth.User')
+        # invalidate cached device and sensor lookups and locations
+        import peil.lookup
+        import peil.locations
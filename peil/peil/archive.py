@@ -0,0 +1,98 @@
+'''
+Created on Oct 18, 2026
+
+Archive of original uplinks from TTN and KPN, and reprocessing of archived uplinks
+'''
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+import json
+import re
+import zlib
+import logging
+
+from peil.models import Uplink
+from peil.decoder import decode_many
+from peil.ingest import parse_payloads
+from peil.util import ttn_row, store_rows, kpn_row, kpn_device
+
+logger = logging.getLogger(__name__)
+
+# find the serial without parsing the whole body
+SERIAL_PATTERNS = {
+    'ttn': re.compile(r'"hardware_serial"\s*:\s*"([^"]*)"'),
+    'kpn': re.compile(r'<(?:\w+:)?DevEUI>([^<]*)</'),
+    }
+
+def create(source, body):
+    ''' create Uplink with the compressed content of an uplink '''
+    match = SERIAL_PATTERNS[source].search(body)
+    serial = match.group(1)[:40] if match else ''
+    return Uplink.objects.create(source=source, serial=serial, received=timezone.now(), body=zlib.compress(body))
+
+def store(source, body):
+    """
+    @summary: archive the original content of an uplink
+    @param source: 'ttn' or 'kpn'
+    @param body: content of the request
+    @return: Uplink instance or None when archiving is disabled or failed
+    """
+    if not getattr(settings,'ARCHIVE_UPLINKS',True):
+        return None
+    try:
+        return create(source, body)
+    except Exception:
+        # never refuse an uplink because the archive is unavailable
+        logger.exception('Error archiving {} uplink'.format(source))
+        return None
+
+def reprocess_ttn(uplinks, orion=None):
+    """ store messages of archived TTN uplinks. Returns list of (message, created) and list of (uplink, error) for uplinks that failed """
+    rows = []
+    failed = []
+    for uplink in uplinks:
+        try:
+            rows.append(ttn_row(json.loads(uplink.data())))
+        except Exception as e:
+            logger.error('Error parsing uplink {}: {}'.format(uplink.pk, e))
+            failed.append((uplink, e))
+    return store_rows(rows, orion) if rows else [], failed
+
+def reprocess_kpn(uplinks, orion=None):
+    """ store messages of archived KPN uplinks, decoding all payloads at once.
+        Returns list of (message, created) and list of (uplink, error) for uplinks that failed """
+    rows = []
+    failed = []
+    for uplink in uplinks:
+        try:
+            rows.append((uplink, kpn_row(uplink.data())))
+        except Exception as e:
+            logger.error('Error parsing uplink {}: {}'.format(uplink.pk, e))
+            failed.append((uplink, e))
+    payloads = decode_many([hex for _uplink, (_serial, _time, hex) in rows])
+    messages = []
+    for (uplink, (serial, time, hex)), payload in zip(rows, payloads):
+        if payload is None:
+            logger.error('Invalid payload {} from {}'.format(hex, serial))
+            failed.append((uplink, ValueError('Invalid payload {}'.format(hex))))
+            continue
+        messages.append((kpn_device(serial, time, orion), time, payload))
+    return parse_payloads(messages, orion), failed
+
+def reprocess(uplinks, orion=None, failed=None):
+    """
+    @summary: rebuild the messages of a batch of archived uplinks in one transaction. Existing messages are updated
+    @param orion: optional Orion instance to publish the messages to
+    @param failed: optional list. Uplinks that can not be parsed or decoded are appended as (uplink, error) tuples
+    @return: list of (message, created) tuples
+    """
+    result = []
+    with transaction.atomic():
+        for source, func in (('ttn', reprocess_ttn), ('kpn', reprocess_kpn)):
+            selected = [u for u in uplinks if u.source == source]
+            if selected:
+                messages, errors = func(selected, orion)
+                result.extend(messages)
+                if failed is not None:
+                    failed.extend(errors)
+    return result
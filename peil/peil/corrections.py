@@ -0,0 +1,129 @@
+'''
+Created on Oct 18, 2026
+
+Local cache of IGS broadcast, ephemeris and clock files used for rtk postprocessing.
+Files are downloaded to a temporary file, checked and renamed, so the cache never contains partial downloads
+'''
+from django.conf import settings
+from contextlib import contextmanager
+import os
+import time
+import fcntl
+import shutil
+import tempfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+# magic bytes of compressed files
+GZIP_MAGIC = b'\x1f\x8b'
+COMPRESS_MAGIC = b'\x1f\x9d'
+
+@contextmanager
+def lock(path):
+    ''' exclusive lock for a file in the cache, shared by threads and processes '''
+    with open(path + '.lock', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def valid(path):
+    ''' check that a gzip (.gz) or unix compress (.Z) file is complete and can be decompressed '''
+    magic = {'.gz': GZIP_MAGIC, '.Z': COMPRESS_MAGIC}.get(os.path.splitext(path)[1])
+    try:
+        if magic is None:
+            return os.path.getsize(path) > 0
+        with open(path, 'rb') as f:
+            if f.read(2) != magic:
+                return False
+        # gzip also tests files in the unix compress format
+        import subprocess32 as subprocess
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.call(['gzip', '-t', path], stdout=devnull, stderr=devnull) == 0
+    except (IOError, OSError) as e:
+        logger.debug('Invalid file {}: {}'.format(path, e))
+        return False
+
+def fetch(root, path, remote, check=False):
+    """
+    @summary: get local file root/path. Download from remote if the file does not exist or is corrupt.
+        Files are only renamed into the cache after they passed the integrity check, so cached files are trusted
+    @param check: test the integrity of a cached file, for instance when it is suspected to be corrupt
+    @return: full path of the local file or None when the file is not available
+    """
+    from peil.util import download
+
+    local_file = os.path.join(root, path)
+    if os.path.exists(local_file) and not check:
+        return local_file
+    destdir = os.path.dirname(local_file)
+    if not os.path.exists(destdir):
+        try:
+            os.makedirs(destdir)
+        except OSError:
+            # created by another process
+            pass
+    with lock(local_file):
+        # another process may have downloaded the file while we were waiting for the lock
+        if os.path.exists(local_file):
+            if not check or valid(local_file):
+                return local_file
+            logger.warning('Removing corrupt file {}'.format(local_file))
+            os.remove(local_file)
+        missing = local_file + '.missing'
+        if os.path.exists(missing) and time.time() - os.path.getmtime(missing) < getattr(settings, 'GNSS_RETRY', 3600):
+            # not available at previous attempt
+            return None
+        logger.debug('Downloading {} from {}'.format(path, remote))
+        # keep the extension, it determines the integrity check
+        fd, temp = tempfile.mkstemp(dir=destdir, prefix='.download.', suffix=os.path.basename(local_file))
+        os.close(fd)
+        try:
+            if download(remote + path, temp) and valid(temp):
+                os.rename(temp, local_file)
+                if os.path.exists(missing):
+                    os.remove(missing)
+                return local_file
+            logger.debug('Download of {} failed'.format(path))
+            with open(missing, 'w'):
+                pass
+            return None
+        except Exception as e:
+            logger.error('Download of {} failed: {}'.format(path, e))
+            return None
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+def discard(root, paths):
+    """ remove files from the cache that have been superseded by a better product.
+    Files are kept for GNSS_DISCARD_AFTER seconds after they were downloaded, because running jobs may still link them
+    """
+    grace = getattr(settings, 'GNSS_DISCARD_AFTER', 3600)
+    for path in paths:
+        local_file = os.path.join(root, path)
+        if os.path.exists(local_file):
+            with lock(local_file):
+                if os.path.exists(local_file) and time.time() - os.path.getmtime(local_file) > grace:
+                    logger.debug('Removing superseded file {}'.format(local_file))
+                    os.remove(local_file)
+
+def link(files, destdir):
+    """ add cached files to a working dir with hard links, or copies when linking is not possible.
+    Raises IOError when a file has been removed from the cache
+    """
+    result = []
+    for fname in files:
+        dest = os.path.join(destdir, os.path.basename(fname))
+        # the lock keeps discard from removing the file while it is being linked
+        with lock(fname):
+            if not os.path.exists(fname):
+                raise IOError('File {} has been removed from the cache'.format(fname))
+            try:
+                os.link(fname, dest)
+            except OSError:
+                shutil.copy(fname, dest)
+        result.append(dest)
+    return result
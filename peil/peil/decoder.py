@@ -5,6 +5,7 @@ Created on Dec 6, 2017
 '''
 import binascii
 import struct
+import numpy as np
 
 def decode(payload):
     ''' decode hex payload '''
@@ -53,6 +54,65 @@ def decode(payload):
             })
     return result
 
+# binary layout of the data of every message type, after the type and position bytes (little endian)
+LAYOUTS = {
+    1: [('latitude','<u4'), ('longitude','<u4'), ('height','<u4'), ('hMSL','<u4'), ('hAcc','<u4'), ('vAcc','<u4')],
+    2: [('temperature','<u2'), ('ec1','<u2'), ('ec2','<u2')],
+    3: [('pressure','<u2')],
+    5: [('angle','<u2')],
+    6: [('total','u1'), ('battery','<u2'), ('pressure','<u2'), ('angle','<u2')],
+    }
+
+def dtype(message_type):
+    ''' returns numpy structured dtype of a complete payload of a message type '''
+    return np.dtype([('type','u1'), ('position','u1')] + LAYOUTS.get(message_type, []))
+
+def decode_columns(payloads, hex=True):
+    """
+    @summary: decode a batch of payloads per message type with numpy
+    @param payloads: sequence of hex strings (or bytes when hex=False)
+    @return: dict of message type to dict of column name to numpy array, and list of indices of invalid payloads.
+        Every group has a column 'index' with the positions of its payloads in the input
+    """
+    if hex:
+        payloads = [binascii.a2b_hex(p) for p in payloads]
+    if not payloads:
+        return {}, []
+    types = np.array([ord(p[0:1]) if p else -1 for p in payloads])
+    lengths = np.array([len(p) for p in payloads])
+    groups = {}
+    invalid = []
+    for message_type in np.unique(types):
+        if message_type < 0:
+            invalid.extend(np.flatnonzero(types == message_type).tolist())
+            continue
+        dt = dtype(message_type)
+        selected = types == message_type
+        if message_type in LAYOUTS:
+            valid = selected & (lengths == dt.itemsize)
+        else:
+            # unknown type: only type and position are decoded
+            valid = selected & (lengths >= dt.itemsize)
+        invalid.extend(np.flatnonzero(selected & ~valid).tolist())
+        index = np.flatnonzero(valid)
+        if len(index) == 0:
+            continue
+        data = np.frombuffer(b''.join(payloads[i][:dt.itemsize] for i in index), dtype=dt)
+        columns = {name: data[name] for name in dt.names}
+        columns['index'] = index
+        groups[int(message_type)] = columns
+    return groups, sorted(invalid)
+
+def decode_many(payloads, hex=True):
+    """ decode a batch of payloads. Returns list with the same dicts as decode() in the order of the input, or None for invalid payloads """
+    groups, _invalid = decode_columns(payloads, hex)
+    result = [None] * len(payloads)
+    for columns in groups.values():
+        names = [name for name in columns if name != 'index']
+        for i, values in zip(columns['index'].tolist(), zip(*[columns[name].tolist() for name in names])):
+            result[i] = dict(zip(names, values))
+    return result
+
 if __name__ == '__main__':
     print decode('0303a907')
     
\ No newline at end of file
@@ -0,0 +1,85 @@
+'''
+Created on Oct 18, 2026
+
+Downsampling of time series for charts
+'''
+import numpy as np
+import pandas as pd
+
+METHODS = ('lttb', 'minmax')
+
+def lttb(x, y, threshold):
+    """
+    @summary: Largest-Triangle-Three-Buckets downsampling (Steinarsson, 2013)
+    @param x: numpy array with increasing x values
+    @param y: numpy array with y values, no NaN
+    @param threshold: maximum number of points to return
+    @return: numpy array with indices of selected points
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    # first and last point are always selected, the points in between are divided into threshold-2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    indices = np.empty(threshold, dtype=int)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i+1]
+        if i < threshold - 3:
+            avg_x = x[hi:edges[i+2]].mean()
+            avg_y = y[hi:edges[i+2]].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        # select point in this bucket with largest triangle area with previous selected point and average of next bucket
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        indices[i+1] = a
+    return indices
+
+def minmax(x, y, threshold):
+    """
+    @summary: min/max downsampling: keep minimum and maximum of every bucket
+    @param x: numpy array with increasing x values
+    @param y: numpy array with y values, no NaN
+    @param threshold: maximum number of points to return
+    @return: numpy array with indices of selected points
+    """
+    n = len(x)
+    if threshold >= n or threshold < 2:
+        return np.arange(n)
+    edges = np.linspace(0, n, threshold // 2 + 1).astype(int)
+    indices = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        if hi > lo:
+            bucket = y[lo:hi]
+            indices.extend((lo + int(np.argmin(bucket)), lo + int(np.argmax(bucket))))
+    return np.unique(indices)
+
+def downsample(series, max_points=None, method='lttb'):
+    """
+    @summary: downsample a time series
+    @param series: Pandas series indexed on time
+    @param max_points: maximum number of points to return. No downsampling when None
+    @param method: 'lttb' or 'minmax'
+    @return: Pandas series without NaN values and at most max_points values
+    """
+    series = series.dropna()
+    if not max_points or len(series) <= max_points:
+        return series
+    x = series.index.asi8.astype(float)
+    y = series.values.astype(float)
+    func = {'lttb': lttb, 'minmax': minmax}[method]
+    return series.iloc[func(x, y, max_points)]
+
+def points(series, max_points=None, method='lttb'):
+    """ returns list of [milliseconds since 1970-01-01, value] pairs for highcharts """
+    series = downsample(series, max_points, method)
+    if series.empty:
+        return []
+    index = pd.DatetimeIndex(series.index)
+    if index.tz is None:
+        index = index.tz_localize('UTC')
+    ms = ((index - pd.Timestamp(0, tz='UTC')).total_seconds() * 1000).astype(np.int64)
+    return zip(ms.tolist(), series.values.tolist())
@@ -5,10 +5,13 @@ Created on Nov 7, 2017
 '''
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 import json
 from peil.util import last_waterlevel
 from peil.models import StatusMessage, PressureMessage, InclinationMessage,\
-    ECMessage
+    ECMessage, Device
+from peil.locations import current_locations
 import six
 import logging
 from datetime import datetime
@@ -86,11 +89,125 @@ class NGSI:
             }
         }
 
+    @staticmethod
+    def device(device, pos=None):
+        ''' return NGSI entity of a peilstok device with its latest values.
+            pos is the current location of the device (default device.current_location())
+        '''
+        data = {
+            'id': device.devid,
+            'type': 'Peilstok',
+            'displayName': {
+                'value': device.displayname
+            },
+            'lastSeen': NGSI.timestamp(device.last_seen)
+        }
+
+        if pos is None:
+            pos = device.current_location()
+        if pos:
+            data['location'] = {
+                'type': 'geo:Point',
+                'value': '{lon},{lat}'.format(lon=pos['lon'], lat=pos['lat']),
+                'metadata': {
+                'coordinateSystem': {
+                    'value': 'EPSG4326'
+                    }
+                }
+            }
+            # add lat and lon as separate attributes as well
+            data['latitude'] = {
+                'value': pos['lat'],
+                'type': 'Float'
+            }
+            data['longitude'] = {
+                'value': pos['lon'],
+                'type': 'Float'
+            }
+        
+        def update(ident, position, typename, unit):
+            latest = device.get_latest(ident, position)
+            if latest:
+                value = latest.value
+                if value is not None and typename == 'Integer':
+                    value = int(value)
+                data.update(NGSI.lora_message(latest.to_message(),value,typename,unit))
+
+        update('Inclinometer',0,'Integer','degree')
+        update('Batterij',0,'Integer','mV')
+        update('Luchtdruk',0,'Float','hPa')
+        update('Waterdruk',3,'Float','hPa')
+        
+        level = last_waterlevel(device)
+        if 'cm' in level:
+            level['name'] = 'waterLevel'
+            data.update(NGSI.lora_message(level,level['cm'],'Float','cm'))
+
+        update('EC1',1,'Float','mS/cm')
+        update('EC2',2,'Float','mS/cm')
+        return data
+
+    @staticmethod
+    def view(device, pos=None):
+        ''' return NGSI entity of a peilstok view for wirecloud popups '''
+        data = {
+            'id': 'view_'+device.devid,
+            'type': 'PeilstokView',
+            'displayName': {
+                'value': device.displayname
+            },
+            'lastSeen': NGSI.timestamp(device.last_seen)
+        }
+
+        if pos is None:
+            pos = device.current_location()
+        if pos:
+            data['latitude'] = {
+                'value': pos['lat'],
+                'type': 'Float'
+            }
+            data['longitude'] = {
+                'value': pos['lon'],
+                'type': 'Float'
+            }
+            
+        def update(ident, position, typename):
+            latest = device.get_latest(ident, position)
+            if latest:
+                value = latest.value
+                if value is not None and typename == 'Integer':
+                    value = int(value)
+                data.update({NGSI.attribute(latest.to_message()):{'value':value,'type':typename}})
+
+        update('Inclinometer',0,'Integer')
+        update('Batterij',0,'Integer')
+        update('Luchtdruk',0,'Float')
+        update('Waterdruk',3,'Float')
+        update('EC1',1,'Float')
+        update('EC2',2,'Float')
+
+        level = last_waterlevel(device)
+        if level:
+            data.update({'waterLevel':{'value':level['nap'],'type':'Float'}})
+        return data
+
 class Orion:
-    ''' Interface to Orion Context Broker '''
+    ''' Interface to Orion Context Broker. Connections are kept alive and reused '''
 
-    def __init__(self, url, **kwargs):
+    def __init__(self, url, pool_size=10, retries=3, backoff=0.5, timeout=30, batch_size=500, **kwargs):
+        """
+        @param url: url of the NGSI v2 api, ending with a slash
+        @param pool_size: maximum number of connections to keep open
+        @param retries: number of retries after connection errors and 5xx responses, with exponential backoff
+        @param timeout: timeout of requests in seconds
+        @param batch_size: maximum number of entities per batch request
+        """
         self.url = url
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(500, 502, 503, 504), method_whitelist=False)
+        self.session.mount(url, HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry))
 
     def log_response(self, response):
         ''' send response to log system '''
@@ -103,27 +220,51 @@ class Orion:
     def get(self,path,**kwargs):
         url = self.url+path
         logger.debug('GET {}?{}'.format(url,kwargs))
-        return requests.get(url,**kwargs)
+        kwargs.setdefault('timeout',self.timeout)
+        return self.session.get(url,**kwargs)
             
     def post(self,path,data,headers={'content-type':'application/json'}):
         url = self.url+path
         logger.debug('POST {}?{}'.format(url,data))
-        return requests.post(self.url+path,data,headers=headers)
+        return self.session.post(url,data,headers=headers,timeout=self.timeout)
 
     def put(self,path,data,headers={'content-type':'application/json'}):
         url = self.url+path
         logger.debug('PUT {}?{}'.format(url,data))
-        return requests.put(url,data,headers=headers)
+        return self.session.put(url,data,headers=headers,timeout=self.timeout)
 
     def delete(self,path,headers={'content-type':'application/json'}):
         url = self.url+path
-        logger.debug('DELETE {}?{}'.format(url))
-        return requests.delete(url,headers=headers)
+        logger.debug('DELETE {}'.format(url))
+        return self.session.delete(url,headers=headers,timeout=self.timeout)
 
     def create_entity(self, data):
         ''' create new entity '''
         return self.post('entities',json.dumps(data))
     
+    def batch(self, action, entities):
+        """
+        @summary: NGSI v2 batch operation on entities, in requests of at most batch_size entities
+        @param action: actionType of the batch operation (append, appendStrict, update, delete or replace)
+        @param entities: list of entities, as dicts with id, type and attributes
+        @return: list of responses, one per request
+        """
+        entities = list(entities)
+        responses = []
+        for i in range(0, len(entities), self.batch_size):
+            data = {'actionType': action, 'entities': entities[i:i+self.batch_size]}
+            logger.debug('Batch {} of {} entities'.format(action, len(data['entities'])))
+            responses.append(self.log_response(self.post('op/update',json.dumps(data))))
+        return responses
+
+    def create_entities(self, entities):
+        ''' create entities. Attributes of entities that exist already are added or replaced '''
+        return self.batch('append', entities)
+
+    def update_entities(self, entities, action='append'):
+        ''' update attributes of entities. Use action='update' to fail for attributes or entities that do not exist '''
+        return self.batch(action, entities)
+
     def update_attribute(self, entity_id, attribute_name, data):
         ''' update attribute of existing entity '''
         path = 'entities/{id}/attrs/{att}'.format(id=entity_id,att=attribute_name)
@@ -196,65 +337,7 @@ class Orion:
     
     def create_device(self, device):
         ''' create a peilstok device in Orion '''
-        data = {
-            'id': device.devid,
-            'type': 'Peilstok',
-            'displayName': {
-                'value': device.displayname
-            },
-            'lastSeen': NGSI.timestamp(device.last_seen)
-        }
-
-        pos = device.current_location()
-        if pos:
-            data['location'] = {
-                'type': 'geo:Point',
-                'value': '{lon},{lat}'.format(lon=pos['lon'], lat=pos['lat']),
-                'metadata': {
-                'coordinateSystem': {
-                    'value': 'EPSG4326'
-                    }
-                }
-            }
-            # add lat and lon as separate attributes as well
-            data['latitude'] = {
-                'value': pos['lat'],
-                'type': 'Float'
-            }
-            data['longitude'] = {
-                'value': pos['lon'],
-                'type': 'Float'
-            }
-        
-        inc = device.get_sensor('Inclinometer',position=0).last_message()
-        if inc:
-            data.update(NGSI.lora_message(inc,inc.value(),'Integer','degree'))
-        
-        bat = device.get_sensor('Batterij',position=0).last_message()
-        if bat:
-            data.update(NGSI.lora_message(bat,bat.value(),'Integer','mV'))
-        
-        air = device.get_sensor('Luchtdruk',position=0).last_message()
-        if air:
-            data.update(NGSI.lora_message(air,air.value(),'Float','hPa'))
-        
-        wat = device.get_sensor('Waterdruk',position=3).last_message()
-        if wat:
-            data.update(NGSI.lora_message(wat,wat.value(),'Float','hPa'))        
-        
-        level = last_waterlevel(device)
-        if 'cm' in level:
-            level['name'] = 'waterLevel'
-            data.update(NGSI.lora_message(level,level['cm'],'Float','cm'))
-
-        ec = device.get_sensor('EC1',position=1).last_message() 
-        if ec:
-            data.update(NGSI.lora_message(ec,ec.value(),'Float','mS/cm'))
-
-        ec = device.get_sensor('EC2',position=2).last_message() 
-        if ec:
-            data.update(NGSI.lora_message(ec,ec.value(),'Float','mS/cm'))
-
+        data = NGSI.device(device)
         logger.debug('Creating entity {}'.format(device.devid))
 
         response = self.create_entity(data)
@@ -266,62 +349,20 @@ class Orion:
     
     def create_view(self, device):
         ''' create a peilstok view in Orion for wirecloud popups '''
-        data = {
-            'id': 'view_'+device.devid,
-            'type': 'PeilstokView',
-            'displayName': {
-                'value': device.displayname
-            },
-            'lastSeen': NGSI.timestamp(device.last_seen)
-        }
-
-        pos = device.current_location()
-        if pos:
-            data['latitude'] = {
-                'value': pos['lat'],
-                'type': 'Float'
-            }
-            data['longitude'] = {
-                'value': pos['lon'],
-                'type': 'Float'
-            }
-            
-        def update(msg):
-            if msg:
-                val = msg.value()
-                if isinstance(val,(int,long)):
-                    typename = 'Integer'
-                elif isinstance(val, float):
-                    typename = 'Float'
-                else:
-                    val = str(val)
-                    typename = 'Text'
-                data.update({NGSI.attribute(msg):{'value':val,'type':typename}})
-
-        inc = device.get_sensor('Inclinometer',position=0).last_message()
-        update(inc)
-        
-        bat = device.get_sensor('Batterij',position=0).last_message()
-        update(bat)
-
-        air = device.get_sensor('Luchtdruk',position=0).last_message()
-        update(air)
-        
-        wat = device.get_sensor('Waterdruk',position=3).last_message()
-        update(wat)
-        
-        ec = device.get_sensor('EC1',position=1).last_message() 
-        update(ec)
-
-        ec = device.get_sensor('EC2',position=2).last_message() 
-        update(ec)
-
-        level = last_waterlevel(device)
-        if level:
-            data.update({'waterLevel':{'value':level['nap'],'type':'Float'}})
-
+        data = NGSI.view(device)
         logger.debug('Creating entity {}'.format(data['id']))
         response = self.create_entity(data)
         return self.log_response(response)
-    
-        
\ No newline at end of file
+
+    def create_devices(self, devices):
+        ''' create or update peilstok devices and their views in Orion with batch requests '''
+        devices = list(devices)
+        Device.prefetch_latest(devices)
+        Device.prefetch_surveys(devices)
+        locations = current_locations(device_ids=[d.pk for d in devices])
+        entities = []
+        for device in devices:
+            pos = locations.get(device.pk, {})
+            entities.append(NGSI.device(device, pos))
+            entities.append(NGSI.view(device, pos))
+        return self.create_entities(entities)
@@ -72,27 +72,20 @@ UBX_NAV_POSLLH = 0x0102
 UBX_NAV_PVT = 0x0701
 
 def readubx(ubxfile):
-    with open(ubxfile,'rb') as ubx:
-        while True:
-            data=ubx.read(6)
-            if len(data) != 6:
-                break
-            hdr, msgid, length = struct.unpack('<HHH',data)
-            print hex(msgid), 
-            if hdr != UBX_HEADER:
-                raise ValueError('UBX header tag expected')
-            data = ubx.read(length)
-            checksum = ubx.read(2)
-            if msgid == UBX_RXM_RAW:
-                print 'UBX-RXM-RAW', ubx_raw(data)
-            elif msgid == UBX_RXM_SFRB:
-                print 'UBX-RXM-SFRB', ubx_sfrb(data)
-            elif msgid == UBX_NAV_POSLLH:
-                print 'UBX-NAV-POSLLH', ubx_nav_posllh(data)
-            elif msgid == UBX_NAV_PVT:
-                print 'UBX-NAV-PVT', ubx_nav_pvt(data)
-            else:
-                raise ValueError('Message not supported: %x' % msgid)
+    from peil.ublox import iterframes
+    for msgid, payload in iterframes(ubxfile):
+        data = payload.tobytes()
+        print hex(msgid), 
+        if msgid == UBX_RXM_RAW:
+            print 'UBX-RXM-RAW', ubx_raw(data)
+        elif msgid == UBX_RXM_SFRB:
+            print 'UBX-RXM-SFRB', ubx_sfrb(data)
+        elif msgid == UBX_NAV_POSLLH:
+            print 'UBX-NAV-POSLLH', ubx_nav_posllh(data)
+        elif msgid == UBX_NAV_PVT:
+            print 'UBX-NAV-PVT', ubx_nav_pvt(data[:84])
+        else:
+            print 'not supported'
 
 def readpos(posfile):
     """ read rnx2rtkp solution file """ 
@@ -0,0 +1,98 @@
+'''
+Created on Oct 18, 2026
+
+Queue of received uplinks. The webhooks validate and enqueue uplinks, manage.py ingest_worker stores the messages
+'''
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
+import json
+import logging
+
+from peil.models import PendingUplink
+from peil import archive
+from peil.util import kpn_row
+
+logger = logging.getLogger(__name__)
+
+def validate(source, body):
+    ''' check that an uplink can be parsed. Raises ValueError when it can not '''
+    try:
+        if source == 'ttn':
+            ttn = json.loads(body)
+            ttn['hardware_serial'], ttn['dev_id'], ttn['metadata']['time']
+        else:
+            kpn_row(body)
+    except Exception as e:
+        raise ValueError('Invalid {} uplink: {}'.format(source, e))
+
+def enqueue(source, body):
+    ''' archive an uplink and add it to the queue '''
+    with transaction.atomic():
+        uplink = archive.create(source, body)
+        return PendingUplink.objects.create(uplink=uplink)
+
+class Worker:
+    ''' stores the messages of queued uplinks in batches '''
+
+    def __init__(self, orion=None, batch_size=500, max_attempts=5, backoff=60):
+        """
+        @param orion: optional Orion instance to publish the messages to
+        @param batch_size: maximum number of uplinks per transaction
+        @param max_attempts: uplinks that failed this many times are kept as dead letters
+        @param backoff: seconds to wait before the first retry, doubled after every failure
+        """
+        self.orion = orion
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+    def failed(self, pending, error):
+        pending.attempts += 1
+        pending.error = str(error)[:1000]
+        pending.dead = pending.attempts >= self.max_attempts
+        pending.next_attempt = timezone.now() + timedelta(seconds=self.backoff * 2 ** (pending.attempts - 1))
+        pending.save(update_fields=['attempts','error','dead','next_attempt'])
+        if pending.dead:
+            logger.error('Giving up on uplink {}: {}'.format(pending.uplink_id, error))
+
+    def process(self):
+        """
+        @summary: store the messages of a batch of queued uplinks
+        @return: number of processed uplinks
+        """
+        with transaction.atomic():
+            # skip uplinks that are locked by other workers
+            pending = list(PendingUplink.objects.select_for_update(skip_locked=True)
+                           .filter(dead=False, next_attempt__lte=timezone.now())
+                           .select_related('uplink').order_by('id')[:self.batch_size])
+            if not pending:
+                return 0
+            failed = []
+            try:
+                archive.reprocess([p.uplink for p in pending], self.orion, failed)
+            except Exception as e:
+                # find the culprit(s) by storing the uplinks one by one
+                logger.error('Error processing batch of {} uplinks: {}'.format(len(pending), e))
+                failed = []
+                for p in pending:
+                    try:
+                        archive.reprocess([p.uplink], self.orion, failed)
+                    except Exception as e:
+                        failed.append((p.uplink, e))
+            # uplinks that could not be parsed or stored are retried later or kept as dead letters
+            errors = {uplink.pk: error for uplink, error in failed}
+            for p in pending:
+                if p.uplink_id in errors:
+                    self.failed(p, errors[p.uplink_id])
+            PendingUplink.objects.filter(pk__in=[p.pk for p in pending if p.uplink_id not in errors]).delete()
+        return len(pending)
+
+    def drain(self):
+        """ process until the queue is empty. Returns number of processed uplinks """
+        total = 0
+        while True:
+            count = self.process()
+            if not count:
+                return total
+            total += count
@@ -0,0 +1,208 @@
+'''
+Created on Oct 18, 2026
+
+Batched ingestion of decoded LoRa payloads.
+Sensors are resolved once per batch and messages are written with bulk inserts
+'''
+from collections import OrderedDict
+from django.db import transaction, router
+from django.contrib.contenttypes.models import ContentType
+
+import logging
+from peil.models import Sensor, LoraMessage, GNSS_MESSAGE, EC_MESSAGE, STATUS_MESSAGE, PRESSURE_MESSAGE, ANGLE_MESSAGE,\
+    PressureSensor, PressureMessage, GNSS_Sensor, BatterySensor, StatusMessage, AngleSensor, InclinationMessage,\
+    LocationMessage, ECSensor, ECMessage, Latest
+from peil.lookup import resolver
+from peil import locations, rollup
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# number of rows per INSERT statement
+BATCH_SIZE = 1000
+
+# sensor class, position (None = take position from payload), default ident, message class and mapping of message fields to payload keys
+PAYLOAD_MAP = {
+    STATUS_MESSAGE: [
+        (PressureSensor, 0, 'Luchtdruk', PressureMessage, {'adc': 'pressure'}),
+        (BatterySensor, 0, 'Batterij', StatusMessage, {'battery': 'battery'}),
+        (AngleSensor, 0, 'Inclinometer', InclinationMessage, {'angle': 'angle'}),
+        ],
+    GNSS_MESSAGE: [
+        (GNSS_Sensor, 0, 'GPS', LocationMessage, {
+            'lat': 'latitude',
+            'lon': 'longitude',
+            'alt': 'height',
+            'vacc': 'vAcc',
+            'hacc': 'hAcc',
+            'msl': 'hMSL'}),
+        ],
+    EC_MESSAGE: [
+        (ECSensor, None, 'EC{position}', ECMessage, {'adc1': 'ec1', 'adc2': 'ec2', 'temperature': 'temperature'}),
+        ],
+    PRESSURE_MESSAGE: [
+        (PressureSensor, None, 'Waterdruk', PressureMessage, {'adc': 'pressure'}),
+        ],
+    ANGLE_MESSAGE: [
+        (AngleSensor, 0, 'Inclinometer', InclinationMessage, {'angle': 'angle'}),
+        ],
+    }
+
+def ctype(model):
+    ''' returns content type id of a (polymorphic) model '''
+    return ContentType.objects.get_for_model(model, for_concrete_model=False).id
+
+def iterfields(message_type, payload):
+    ''' generates sensor key, default ident, message class and message fields from a decoded payload '''
+    try:
+        entries = PAYLOAD_MAP[message_type]
+    except KeyError:
+        raise Exception('Unknown message type:'+ str(message_type))
+    for sensor_class, position, ident, message_class, mapping in entries:
+        if position is None:
+            position = payload['position']
+        fields = {name: payload[key] for name, key in mapping.items()}
+        yield sensor_class, position, ident.format(position=position), message_class, fields
+
+class SensorMap:
+    ''' in-memory map of (device, sensor class, position) to sensor instance '''
+
+    def __init__(self, devices):
+        self.devices = {d.pk: d for d in devices}
+        self.sensors = {}
+        missing = []
+        for pk in self.devices:
+            sensors = resolver.get_sensors(pk)
+            if sensors is None:
+                missing.append(pk)
+            else:
+                self.add(pk, sensors)
+        if missing:
+            loaded = {pk: {} for pk in missing}
+            for sensor in Sensor.objects.filter(device_id__in=missing).order_by('-pk'):
+                # when there are duplicates, keep the first sensor that was created (like get_or_create does)
+                loaded[sensor.device_id][(sensor.polymorphic_ctype_id, sensor.position)] = sensor
+            for pk, sensors in loaded.items():
+                resolver.set_sensors(pk, sensors)
+                self.add(pk, sensors)
+
+    def add(self, device_id, sensors):
+        device = self.devices[device_id]
+        for (ctype_id, position), sensor in sensors.items():
+            sensor.device = device
+            self.sensors[(device_id, ctype_id, position)] = sensor
+
+    def get_or_create(self, device, sensor_class, position, ident):
+        key = (device.pk, ctype(sensor_class), position)
+        sensor = self.sensors.get(key)
+        if sensor is None:
+            sensor = sensor_class.objects.create(device=device, position=position, ident=ident)
+            logger.info('{}: {} sensor created'.format(device, sensor))
+            self.sensors[key] = sensor
+        return sensor
+
+def bulk_insert_messages(message_class, instances, using):
+    ''' insert new messages into LoraMessage base table and child table with one statement per table per batch.
+        bulk_create() does not support multi-table inheritance, so the child rows are inserted the same way Model.save() does it
+    '''
+    ctype_id = ctype(message_class)
+    for i in range(0, len(instances), BATCH_SIZE):
+        batch = instances[i:i+BATCH_SIZE]
+        base = [LoraMessage(sensor_id=m.sensor_id, time=m.time, polymorphic_ctype_id=ctype_id) for m in batch]
+        # primary keys are returned by postgresql
+        LoraMessage.objects.using(using).non_polymorphic().bulk_create(base)
+        for m, b in zip(batch, base):
+            m.pk = m.loramessage_ptr_id = b.pk
+            m.polymorphic_ctype_id = ctype_id
+        message_class._base_manager.using(using)._insert(batch, fields=message_class._meta.local_concrete_fields, using=using, raw=True)
+
+def update_latest(result):
+    ''' update latest value table with the newest message per sensor in a batch of stored messages '''
+    newest = {}
+    for msg, _created in result:
+        current = newest.get(msg.sensor_id)
+        if current is None or current.time <= msg.time:
+            newest[msg.sensor_id] = msg
+
+    stored = dict(Latest.objects.filter(sensor_id__in=newest.keys()).values_list('sensor_id','time'))
+    for sensor_id, msg in newest.items():
+        values = Latest.values(msg)
+        if sensor_id not in stored:
+            Latest.objects.update_or_create(sensor_id=sensor_id, defaults=values)
+        elif stored[sensor_id] <= msg.time:
+            Latest.objects.filter(sensor_id=sensor_id, time__lte=msg.time).update(**values)
+        msg.sensor.device.clear_latest()
+
+def parse_payloads(messages, orion=None):
+    """
+    @summary: store a batch of decoded payloads
+    @param messages: iterable of (device, server_time, payload) tuples
+    @param orion: optional Orion instance. When given, the messages are published to Orion through the outbox (ORION_OUTBOX) or immediately
+    @return: list of (message, created) tuples
+    """
+    messages = list(messages)
+    if not messages:
+        return []
+
+    devices = {device.pk: device for device, _time, _payload in messages}
+    using = router.db_for_write(LoraMessage)
+
+    with transaction.atomic(using=using):
+        sensors = SensorMap(devices.values())
+
+        # collect messages per (sensor, time). A later message with the same sensor and time replaces an earlier one
+        pending = OrderedDict()
+        for device, server_time, payload in messages:
+            for sensor_class, position, ident, message_class, fields in iterfields(payload['type'], payload):
+                sensor = sensors.get_or_create(device, sensor_class, position, ident)
+                pending[(sensor.pk, server_time)] = (sensor, message_class, fields)
+
+        # find existing messages for these sensors in the time range of this batch
+        sensor_ids = set(s for s, _t in pending.keys())
+        times = [t for _s, t in pending.keys()]
+        query = LoraMessage.objects.using(using).non_polymorphic().filter(sensor_id__in=sensor_ids, time__range=(min(times), max(times)))
+        existing = {(sensor_id, time): pk for pk, sensor_id, time in query.values_list('pk','sensor_id','time')}
+
+        result = []
+        inserts = {}
+        for key, (sensor, message_class, fields) in pending.items():
+            sensor_id, time = key
+            msg = message_class(sensor=sensor, time=time, **fields)
+            pk = existing.get(key)
+            if pk is None:
+                inserts.setdefault(message_class,[]).append(msg)
+                result.append((msg,True))
+            else:
+                message_class.objects.using(using).filter(pk=pk).update(**fields)
+                msg.pk = msg.loramessage_ptr_id = pk
+                result.append((msg,False))
+
+        added = 0
+        for message_class, instances in inserts.items():
+            bulk_insert_messages(message_class, instances, using)
+            added += len(instances)
+
+        update_latest(result)
+
+        if getattr(settings,'ROLLUP_AT_INGEST',True):
+            # recalculate rollups after commit, outside the ingest transaction
+            stored = [msg for msg, _created in result]
+            transaction.on_commit(lambda: rollup.update_messages(stored), using=using)
+
+        outbox = orion and getattr(settings,'ORION_OUTBOX',False)
+        if outbox:
+            # updates for the context broker are published by manage.py orion_publisher
+            from peil.outbox import enqueue
+            enqueue([msg for msg, _created in result])
+
+    if any(isinstance(msg, LocationMessage) for msg, _created in result):
+        # new GPS fix may change current location of device
+        locations.invalidate()
+
+    logger.debug('{} messages added, {} updated'.format(added, len(result) - added))
+
+    if orion and not outbox:
+        for msg, _created in result:
+            orion.update_message(msg)
+
+    return result
@@ -0,0 +1,80 @@
+'''
+Created on Oct 18, 2026
+
+Current locations of all devices in a constant number of queries, cached until a new survey or GPS message arrives.
+The cache must be shared by all processes (settings.LOCATIONS_CACHE), otherwise invalidations by the ingest worker do not reach the web processes
+'''
+from django.conf import settings
+from django.core.cache import caches
+from django.contrib.gis.db.models.functions import Transform
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from collections import OrderedDict
+
+from peil.models import Device, Survey, LocationMessage
+
+VERSION_KEY = 'peil:locations:version'
+
+def get_cache():
+    return caches[getattr(settings,'LOCATIONS_CACHE','default')]
+
+def current_locations(hacc=10000, device_ids=None):
+    """
+    @summary: returns current location of devices
+    Uses location of last survey, or last valid fix of the on-board GPS when device has not been surveyed
+    @param hacc: maximum horizontal accuracy of GPS fixes in mm
+    @param device_ids: optional list of device ids
+    @return: OrderedDict of device id to location
+    """
+    devices = Device.objects.all()
+    surveys = Survey.objects.order_by('device_id','-time').distinct('device_id')
+    fixes = LocationMessage.objects.non_polymorphic().filter(hacc__gt=0).order_by('sensor__device_id','-time').distinct('sensor__device_id')
+    if hacc:
+        fixes = fixes.filter(hacc__lt=hacc)
+    if device_ids is not None:
+        devices = devices.filter(pk__in=device_ids)
+        surveys = surveys.filter(device_id__in=device_ids)
+        fixes = fixes.filter(sensor__device_id__in=device_ids)
+
+    names = OrderedDict(devices.values_list('id','displayname'))
+    result = OrderedDict()
+
+    # transform survey locations from RD to WGS84 in the database
+    for device_id, pnt in surveys.annotate(wgs84=Transform('location',4326)).values_list('device_id','wgs84'):
+        if device_id in names:
+            result[device_id] = {'id': device_id, 'name': names[device_id], 'lon': pnt.x, 'lat': pnt.y}
+
+    for device_id, lon, lat, msl, h, v, time in fixes.values_list('sensor__device_id','lon','lat','msl','hacc','vacc','time'):
+        if device_id in names and device_id not in result:
+            if lon > 40*1e7 and lat < 10*1e7:
+                # verwisseling lon/lat?
+                lon, lat = lat, lon
+            result[device_id] = {'id': device_id, 'name': names[device_id], 'lon': lon*1e-7, 'lat': lat*1e-7, 'msl': msl*1e-3, 'hacc': h*1e-3, 'vacc': v*1e-3, 'time': time}
+
+    # same order as devices
+    return OrderedDict((pk, result[pk]) for pk in names if pk in result)
+
+def cached_locations(hacc=10000):
+    """ returns list of current locations of all devices from cache """
+    cache = get_cache()
+    key = 'peil:locations:{}:{}'.format(cache.get(VERSION_KEY,0), hacc)
+    result = cache.get(key)
+    if result is None:
+        result = current_locations(hacc).values()
+        cache.set(key, result, getattr(settings,'LOCATIONS_CACHE_TIMEOUT',3600))
+    return result
+
+def invalidate():
+    """ invalidate cached locations """
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+@receiver(post_save, sender=Survey)
+@receiver(post_delete, sender=Survey)
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+def location_changed(sender, instance, **kwargs):
+    invalidate()
@@ -0,0 +1,112 @@
+'''
+Created on Oct 18, 2026
+
+Cache for resolving devices and sensors during ingest.
+When settings.INGEST_CACHE names a cache (e.g. a django_redis cache) entries live only in that shared cache, so invalidations reach all processes.
+Otherwise entries live in process memory, which is only safe when a single process stores messages and changes devices.
+Entries are invalidated when a Device or Sensor is saved or deleted.
+'''
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+import time
+import logging
+
+from peil.models import Device, Sensor
+
+logger = logging.getLogger(__name__)
+
+def device_key(**lookup):
+    ''' returns cache key for a device lookup like serial=..., devid=... '''
+    return 'peil:device:' + ':'.join('{}={}'.format(k, lookup[k]) for k in sorted(lookup))
+
+def sensors_key(device_id):
+    ''' returns cache key for the sensors of a device '''
+    return 'peil:sensors:{}'.format(device_id)
+
+def device_keys(serial, devid):
+    ''' returns cache keys of all lookups that resolve to device with serial and devid '''
+    return [device_key(serial=serial, devid=devid), device_key(serial=serial), device_key(devid=devid)]
+
+class Resolver:
+    ''' key/value store for resolved devices and sensors, in a shared cache or in process memory '''
+
+    def __init__(self, alias=None, timeout=300):
+        self.alias = alias
+        self.timeout = timeout
+        self.local = {}
+
+    def shared(self):
+        return caches[self.alias] if self.alias else None
+
+    def get(self, key):
+        shared = self.shared()
+        if shared:
+            # no local copies: they would not see invalidations by other processes
+            return shared.get(key)
+        entry = self.local.get(key)
+        if entry:
+            expires, value = entry
+            if expires > time.time():
+                return value
+            del self.local[key]
+        return None
+
+    def set(self, key, value):
+        shared = self.shared()
+        if shared:
+            shared.set(key, value, self.timeout)
+        else:
+            self.local[key] = (time.time() + self.timeout, value)
+
+    def delete(self, keys):
+        for key in keys:
+            self.local.pop(key, None)
+        shared = self.shared()
+        if shared:
+            shared.delete_many(keys)
+
+    def clear(self):
+        self.local.clear()
+
+    def get_device(self, **lookup):
+        return self.get(device_key(**lookup))
+
+    def set_device(self, device, **lookup):
+        self.set(device_key(**lookup), device)
+
+    def get_sensors(self, device_id):
+        return self.get(sensors_key(device_id))
+
+    def set_sensors(self, device_id, sensors):
+        self.set(sensors_key(device_id), sensors)
+
+resolver = Resolver(getattr(settings,'INGEST_CACHE',None), getattr(settings,'INGEST_CACHE_TIMEOUT',300))
+
+@receiver(pre_save, sender=Device)
+def device_changing(sender, instance, **kwargs):
+    ''' invalidate lookups using the old serial and devid '''
+    if instance.pk:
+        for serial, devid in Device.objects.filter(pk=instance.pk).values_list('serial','devid'):
+            resolver.delete(device_keys(serial, devid))
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+def device_changed(sender, instance, **kwargs):
+    resolver.delete(device_keys(instance.serial, instance.devid) + [sensors_key(instance.pk)])
+
+def sensor_changed(sender, instance, **kwargs):
+    resolver.delete([sensors_key(instance.device_id)])
+
+def sensor_models(model=Sensor):
+    ''' returns Sensor and all its subclasses '''
+    models = [model]
+    for subclass in model.__subclasses__():
+        models.extend(sensor_models(subclass))
+    return models
+
+# signals are sent with the concrete sensor class as sender
+for model in sensor_models():
+    post_save.connect(sensor_changed, sender=model, dispatch_uid='sensor_changed_save_'+model.__name__)
+    post_delete.connect(sensor_changed, sender=model, dispatch_uid='sensor_changed_delete_'+model.__name__)
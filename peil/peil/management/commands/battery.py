@@ -4,7 +4,8 @@ Created on Aug 05, 2017
 @author: theo
 '''
 from django.core.management.base import BaseCommand
-from peil.models import Sensor
+from peil.models import Latest
+import json
 
 class Command(BaseCommand):
     args = ''
@@ -20,13 +21,13 @@ class Command(BaseCommand):
             help='device id')
 
     def handle(self, *args, **options):
-        query = Sensor.objects.filter(ident='Batterij')
+        query = Latest.objects.filter(sensor__ident='Batterij').select_related('sensor__device')
         devid = options['devid']
         if devid:
-            query = query.filter(device__devid=devid)
+            query = query.filter(sensor__device__devid=devid)
         print 'device,timestamp,level,percentage'
         fmt = '{}, {:%Y-%m-%d %H:%M}, {:.2f} mV, {}%'
-        for sensor in query:
-            m = sensor.last_message()
-            level = int(min(500,max(0,m.battery-3000)) / 5.0)
-            print fmt.format(sensor.device, m.time, m.battery*1e-3, level)
\ No newline at end of file
+        for latest in query:
+            battery = json.loads(latest.fields)['battery']
+            level = int(min(500,max(0,battery-3000)) / 5.0)
+            print fmt.format(latest.sensor.device, latest.time, battery*1e-3, level)
\ No newline at end of file
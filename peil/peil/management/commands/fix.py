@@ -5,6 +5,8 @@ Created on Aug 05, 2017
 '''
 from django.core.management.base import BaseCommand
 from peil.models import Device, RTKSolution
+from peil.util import rdnap
+import numpy as np
 
 class Command(BaseCommand):
     args = ''
@@ -30,12 +32,14 @@ class Command(BaseCommand):
             for sur in dev.survey_set.all():
                 print fmt.format(dev, 'sur', sur.time, '', '', '', sur.vacc/1e3, sur.location.x, sur.location.y, sur.altitude) 
             gps = dev.get_sensor('GPS')
-            for pos in gps.loramessage_set.order_by('time'):
-                x,y,z = pos.NAPvalue()
-                # lon/lat have been switched
-                lon = pos.lat/1e7
-                lat = pos.lon/1e7
-                print fmt.format(dev, 'gps', pos.time, lat, lon, pos.alt/1e3, pos.vacc/1e3, x, y, z)
+            positions = list(gps.loramessage_set.order_by('time'))
+            # lon/lat have been switched
+            lon = np.array([pos.lat for pos in positions]) * 1e-7
+            lat = np.array([pos.lon for pos in positions]) * 1e-7
+            alt = np.array([pos.alt for pos in positions]) * 1e-3
+            nap = rdnap.to_rdnap_many(lon, lat, alt).round(2)
+            for pos, (x,y,z) in zip(positions, nap):
+                print fmt.format(dev, 'gps', pos.time, pos.lon/1e7, pos.lat/1e7, pos.alt/1e3, pos.vacc/1e3, x, y, z)
             for sol in RTKSolution.objects.filter(ubx__device=dev).order_by('time'):
                 print fmt.format(dev, 'rtk', sol.time, sol.lat, sol.lon, sol.alt, sol.sdu, sol.x, sol.y, sol.z)
                 
\ No newline at end of file
@@ -4,28 +4,157 @@ Created on Apr 26, 2017
 @author: theo
 '''
 from django.core.management.base import BaseCommand
+from django.db import transaction, connections
+from multiprocessing import Pool, cpu_count
+from collections import deque
+import gzip
 import json
-from peil.util import parse_ttn
-from docutils.nodes import line
+import os
+import time
+import logging
+
+from peil.util import ttn_row, store_rows, get_orion
+
+logger = logging.getLogger(__name__)
+
+def parse_lines(data):
+    """ parse and decode a chunk of json lines. Runs in a worker process
+    @return: list of (device key, server time, payload) tuples and list of (line, error) tuples
+    """
+    rows = []
+    errors = []
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        try:
+            rows.append(ttn_row(json.loads(line)))
+        except Exception as e:
+            errors.append((line, str(e)))
+    return rows, errors
+
+def open_file(fname):
+    ''' open plain or gzipped file '''
+    with open(fname, 'rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(fname, 'rb')
+    return open(fname, 'rb')
+
+def read_chunks(f, size):
+    """ generates (offset, data) of chunks of complete lines, where offset is the position after the chunk """
+    offset = f.tell()
+    rest = b''
+    while True:
+        data = f.read(size)
+        if not data:
+            break
+        data = rest + data
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            # no complete line yet
+            rest = data
+            continue
+        rest = data[end:]
+        offset += end
+        yield offset, data[:end]
+    if rest:
+        yield offset + len(rest), rest
 
 class Command(BaseCommand):
     args = ''
-    help = 'Import ttn file'
-    
+    help = 'Import ttn file with json lines (optionally gzipped)'
+
     def add_arguments(self, parser):
         parser.add_argument('-f','--file',
                 action='store',
                 dest='fname',
                 help='ttn filename')
+        parser.add_argument('-c','--chunk',
+                action='store',
+                type=int,
+                default=4,
+                dest='chunk',
+                help='size of chunks in MB. Every chunk is stored in one transaction')
+        parser.add_argument('-w','--workers',
+                action='store',
+                type=int,
+                default=cpu_count(),
+                dest='workers',
+                help='number of processes for parsing')
+        parser.add_argument('--checkpoint',
+                action='store',
+                dest='checkpoint',
+                help='file with offset of the last stored chunk (default <filename>.offset)')
+        parser.add_argument('--restart',
+                action='store_true',
+                default=False,
+                dest='restart',
+                help='ignore the checkpoint and import the whole file')
+        parser.add_argument('--no-orion',
+                action='store_false',
+                default=True,
+                dest='orion',
+                help='do not publish the imported messages to Orion')
+
+    def store(self, rows, orion):
+        """ store rows in one transaction. When that fails, store them one by one """
+        try:
+            with transaction.atomic():
+                return len(store_rows(rows, orion))
+        except Exception as e:
+            logger.error('Error storing batch of {} messages: {}'.format(len(rows), e))
+        count = 0
+        for row in rows:
+            try:
+                with transaction.atomic():
+                    count += len(store_rows([row], orion))
+            except Exception as e:
+                logger.error('Error storing message {}: {}'.format(row, e))
+        return count
+
     def handle(self, *args, **options):
         fname = options.get('fname')
-        row = 0
-        print fname
-        with open(fname) as f:
-            for line in f:
-                row += 1
-                try:
-                    parse_ttn(json.loads(line))
-                except Exception as e:
-                    print line
-                    print e
\ No newline at end of file
+        checkpoint = options.get('checkpoint') or fname + '.offset'
+        orion = get_orion() if options.get('orion') else None
+        workers = max(1, options.get('workers'))
+
+        offset = 0
+        if not options.get('restart') and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                offset = int(f.read().strip() or 0)
+            logger.info('Resuming {} at offset {}'.format(fname, offset))
+
+        # do not share database connections with the worker processes
+        connections.close_all()
+        pool = Pool(workers)
+        pending = deque()
+        stored = errors = 0
+        start = time.time()
+        try:
+            with open_file(fname) as f:
+                f.seek(offset)
+                chunks = read_chunks(f, options.get('chunk') * 1024 * 1024)
+                while True:
+                    # keep a limited number of chunks in progress and store the results in the order of the file
+                    while len(pending) < workers * 2:
+                        try:
+                            end, data = next(chunks)
+                        except StopIteration:
+                            break
+                        pending.append((end, pool.apply_async(parse_lines, (data,))))
+                    if not pending:
+                        break
+                    end, result = pending.popleft()
+                    rows, failed = result.get()
+                    for line, error in failed:
+                        logger.error('Error parsing line {}: {}'.format(line, error))
+                    errors += len(failed)
+                    stored += self.store(rows, orion)
+                    with open(checkpoint, 'w') as cp:
+                        cp.write(str(end))
+                    elapsed = time.time() - start
+                    logger.info('offset {}: {} messages stored, {:.0f} messages/s'.format(end, stored, stored / elapsed if elapsed else 0))
+        finally:
+            pool.terminate()
+        elapsed = time.time() - start
+        print '{} messages stored in {:.1f} seconds ({:.0f} messages/s), {} lines with errors'.format(stored, elapsed, stored / elapsed if elapsed else 0, errors)
@@ -0,0 +1,55 @@
+'''
+Created on Oct 18, 2026
+'''
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+import time
+import logging
+
+from peil.inbox import Worker
+from peil.util import get_orion
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Store the messages of queued uplinks. Run more workers for more throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once',
+            action='store_true',
+            dest='once',
+            default=False,
+            help='process until the queue is empty and exit')
+        parser.add_argument('-b','--batch',
+            action='store',
+            dest='batch',
+            type=int,
+            default=500,
+            help='maximum number of uplinks per transaction')
+        parser.add_argument('-i','--interval',
+            action='store',
+            dest='interval',
+            type=float,
+            default=1.0,
+            help='seconds to wait when the queue is empty')
+        parser.add_argument('-m','--max-attempts',
+            action='store',
+            dest='attempts',
+            type=int,
+            default=5,
+            help='number of attempts before an uplink is kept as dead letter')
+
+    def handle(self, *args, **options):
+        worker = Worker(get_orion(), batch_size=options['batch'], max_attempts=options['attempts'])
+        while True:
+            try:
+                count = worker.drain()
+                if count:
+                    logger.debug('{} uplinks processed'.format(count))
+            except Exception:
+                logger.exception('Error processing uplinks')
+            if options['once']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,62 @@
+'''
+Created on Oct 18, 2026
+'''
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import close_old_connections
+import time
+import logging
+
+from peil.fiware import Orion
+from peil.outbox import Publisher, PublishError
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Publish pending updates from the outbox to the Orion Context Broker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once',
+            action='store_true',
+            dest='once',
+            default=False,
+            help='publish until the outbox is empty and exit')
+        parser.add_argument('-b','--batch',
+            action='store',
+            dest='batch',
+            type=int,
+            default=500,
+            help='maximum number of updates per batch request')
+        parser.add_argument('-i','--interval',
+            action='store',
+            dest='interval',
+            type=float,
+            default=2.0,
+            help='seconds to wait when the outbox is empty')
+        parser.add_argument('--max-backoff',
+            action='store',
+            dest='max_backoff',
+            type=float,
+            default=300.0,
+            help='maximum number of seconds to wait after failures')
+
+    def handle(self, *args, **options):
+        orion = Orion(settings.ORION_URL, batch_size=options['batch'])
+        publisher = Publisher(orion, batch_size=options['batch'])
+        interval = options['interval']
+        delay = interval
+        while True:
+            try:
+                count = publisher.drain()
+                if count:
+                    logger.debug('{} Orion updates published'.format(count))
+                delay = interval
+            except PublishError as e:
+                # wait longer after every consecutive failure
+                logger.error('Publishing to Orion failed: {}'.format(e))
+                delay = min(delay * 2, options['max_backoff'])
+            if options['once']:
+                break
+            close_old_connections()
+            time.sleep(delay)
@@ -0,0 +1,124 @@
+'''
+Created on Oct 18, 2026
+'''
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from multiprocessing.pool import ThreadPool
+import hashlib
+import json
+import os
+import logging
+
+from peil.models import Device
+from peil.fiware import NGSI, Orion
+from peil.locations import current_locations
+
+logger = logging.getLogger(__name__)
+
+def attribute_hash(value):
+    return hashlib.md5(json.dumps(value, sort_keys=True)).hexdigest()
+
+def load_state(path):
+    ''' returns dict of entity id to dict of attribute name to hash of the last pushed value '''
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+def save_state(path, state):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.rename(tmp, path)
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Synchronize all devices with the Orion Context Broker, sending only changed attributes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-f','--force',
+            action='store_true',
+            dest='force',
+            default=False,
+            help='send all attributes, ignoring the state of the last synchronization')
+        parser.add_argument('-n','--dry-run',
+            action='store_true',
+            dest='dry',
+            default=False,
+            help='only show what would be sent')
+        parser.add_argument('-b','--batch',
+            action='store',
+            dest='batch',
+            type=int,
+            default=100,
+            help='number of entities per request')
+        parser.add_argument('-w','--workers',
+            action='store',
+            dest='workers',
+            type=int,
+            default=4,
+            help='number of parallel requests')
+
+    def desired(self):
+        """ returns list of entities of all devices, computed with a few bulk queries """
+        devices = [d for d in Device.objects.all() if d.last_seen]
+        Device.prefetch_latest(devices)
+        # last surveys for the NAP elevation of the water level
+        Device.prefetch_surveys(devices)
+        locations = current_locations()
+        entities = []
+        for device in devices:
+            pos = locations.get(device.pk, {})
+            entities.append(NGSI.device(device, pos))
+            entities.append(NGSI.view(device, pos))
+        return entities
+
+    def handle(self, *args, **options):
+        path = getattr(settings, 'ORION_SYNC_STATE', os.path.join(settings.BASE_DIR, 'orion_sync.json'))
+        state = {} if options['force'] else load_state(path)
+
+        # keep only the attributes that differ from the last pushed state
+        changes = []
+        hashes = {}
+        for entity in self.desired():
+            entity_id = entity['id']
+            attrs = {name: value for name, value in entity.items() if name not in ('id', 'type')}
+            hashes[entity_id] = {name: attribute_hash(value) for name, value in attrs.items()}
+            known = state.get(entity_id, {})
+            changed = {name: value for name, value in attrs.items() if known.get(name) != hashes[entity_id][name]}
+            if changed:
+                changed.update(id=entity_id, type=entity['type'])
+                changes.append(changed)
+
+        attributes = sum(len(e) - 2 for e in changes)
+        self.stdout.write('{} entities checked, {} entities with {} attributes changed'.format(len(hashes), len(changes), attributes))
+        if options['dry'] or not changes:
+            return
+
+        orion = Orion(settings.ORION_URL, pool_size=options['workers'], batch_size=options['batch'])
+        batches = [changes[i:i+options['batch']] for i in range(0, len(changes), options['batch'])]
+
+        def send(batch):
+            try:
+                responses = orion.update_entities(batch)
+                return batch, all(r.ok for r in responses)
+            except Exception as e:
+                logger.error('Orion sync failed: {}'.format(e))
+                return batch, False
+
+        pool = ThreadPool(options['workers'])
+        try:
+            results = pool.map(send, batches)
+        finally:
+            pool.close()
+
+        failed = 0
+        for batch, ok in results:
+            for entity in batch:
+                if ok:
+                    state[entity['id']] = hashes[entity['id']]
+                else:
+                    failed += 1
+        save_state(path, state)
+        self.stdout.write('{} entities updated, {} failed'.format(len(changes) - failed, failed))
@@ -0,0 +1,114 @@
+'''
+Created on Oct 18, 2026
+'''
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+from datetime import timedelta
+import re
+import time
+
+from peil.models import Device, Sensor, PressureSensor, PressureMessage, LoraMessage
+from peil.ingest import bulk_insert_messages
+
+class Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Show query plans and timing of the queries for messages of a sensor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-s','--sensor',
+            action='store',
+            dest='sensor',
+            type=int,
+            help='sensor id (default the sensor with the most messages)')
+        parser.add_argument('-f','--fill',
+            action='store',
+            dest='fill',
+            type=int,
+            default=0,
+            help='number of synthetic messages to add to a temporary sensor. Everything is rolled back afterwards')
+        parser.add_argument('-n','--repeat',
+            action='store',
+            dest='repeat',
+            type=int,
+            default=20,
+            help='number of executions per query for timing')
+
+    def queries(self, sensor):
+        """ returns list of (name, queryset) of the queries on the message table used by ingest, charts and the latest values """
+        messages = LoraMessage.objects.non_polymorphic().filter(sensor_id=sensor.pk)
+        last = messages.order_by('-time').values_list('time',flat=True).first()
+        if last is None:
+            raise CommandError('Sensor {} has no messages'.format(sensor.pk))
+        day = last - timedelta(days=1)
+        model = sensor.message_model()
+        return [
+            ('last message', messages.order_by('-time')[:1]),
+            ('first message', messages.order_by('time')[:1]),
+            ('messages after time (last_waterlevel)', messages.filter(time__gte=day).order_by('time')),
+            ('ingest lookup', LoraMessage.objects.non_polymorphic().filter(sensor_id__in=[sensor.pk], time__range=(day, last)).values_list('pk','sensor_id','time')),
+            ('update_or_create lookup', messages.filter(time=last).values_list('pk', flat=True)),
+            ('frame of one day', model.objects.non_polymorphic().filter(sensor_id=sensor.pk, time__gte=day).order_by('time').values_list('time', *model.data_fields())),
+            ]
+
+    def explain(self, name, queryset, repeat):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params)
+            plan = [row[0] for row in cursor.fetchall()]
+            start = time.time()
+            for _ in range(repeat):
+                cursor.execute(sql, params)
+                cursor.fetchall()
+            elapsed = (time.time() - start) / max(repeat, 1) * 1000
+        scans = sorted(set(re.findall(r'((?:Index Only|Index|Seq|Bitmap Heap|Bitmap Index) Scan)(?: Backward)? (?:using \S+ )?on (\S+)', '\n'.join(plan))))
+        self.stdout.write('=== {} ({:.2f} ms)'.format(name, elapsed))
+        self.stdout.write(', '.join('{} on {}'.format(scan, table) for scan, table in scans))
+        for line in plan:
+            self.stdout.write(line)
+        self.stdout.write('')
+
+    def busiest(self):
+        """ returns id of the sensor with the most messages """
+        query = LoraMessage.objects.non_polymorphic().values('sensor_id').annotate(count=Count('id')).order_by('-count')
+        for row in query[:1]:
+            return row['sensor_id']
+        raise CommandError('There are no messages')
+
+    def fill(self, count):
+        """ create a temporary sensor with count messages, one per minute """
+        device = Device.objects.create(serial='benchmark', devid='benchmark', displayname='benchmark')
+        sensor = PressureSensor.objects.create(device=device, ident='Waterdruk', position=3)
+        t0 = timezone.now() - timedelta(minutes=count)
+        batch = 100000
+        for i in range(0, count, batch):
+            messages = [PressureMessage(sensor=sensor, time=t0 + timedelta(minutes=j), adc=2000 + j % 100) for j in range(i, min(i + batch, count))]
+            bulk_insert_messages(PressureMessage, messages, connection.alias)
+            self.stdout.write('{} messages added'.format(i + len(messages)))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE peil_loramessage')
+            cursor.execute('ANALYZE peil_pressuremessage')
+        return sensor
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', ['peil_loramessage'])
+            self.stdout.write('Approximately {} messages'.format(cursor.fetchone()[0]))
+        try:
+            with transaction.atomic():
+                if options['fill']:
+                    sensor = self.fill(options['fill'])
+                elif options['sensor']:
+                    sensor = Sensor.objects.get(pk=options['sensor'])
+                else:
+                    sensor = Sensor.objects.get(pk=self.busiest())
+                for name, queryset in self.queries(sensor):
+                    self.explain(name, queryset, options['repeat'])
+                # never keep synthetic messages
+                raise Rollback()
+        except Rollback:
+            pass
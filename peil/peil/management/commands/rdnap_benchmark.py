@@ -0,0 +1,48 @@
+'''
+Created on Oct 18, 2026
+'''
+from django.core.management.base import BaseCommand
+import numpy as np
+import time
+
+from peil.util import TransNAP
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Compare throughput of per-point and batched WGS84 to RD/NAP transformations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n','--points',
+            action='store',
+            dest='points',
+            type=int,
+            default=1000000,
+            help='number of random points in the Netherlands')
+        parser.add_argument('-c','--chunk',
+            action='store',
+            dest='chunk',
+            type=int,
+            default=100000,
+            help='number of points per TransformPoints call')
+
+    def handle(self, *args, **options):
+        n = options['points']
+        rng = np.random.RandomState(0)
+        lon = rng.uniform(3.4, 7.2, n)
+        lat = rng.uniform(50.8, 53.5, n)
+        h = rng.uniform(0, 100, n)
+        trans = TransNAP()
+        # create transformations before timing
+        trans.to_rdnap(lon[0], lat[0], h[0])
+
+        start = time.time()
+        single = np.array([trans.to_rdnap(x, y, z) for x, y, z in zip(lon.tolist(), lat.tolist(), h.tolist())])
+        elapsed = time.time() - start
+        print 'to_rdnap:      {} points in {:.2f} s ({:.0f} points/s)'.format(n, elapsed, n / elapsed)
+
+        start = time.time()
+        batch = trans.to_rdnap_many(lon, lat, h, chunk=options['chunk'])
+        elapsed = time.time() - start
+        print 'to_rdnap_many: {} points in {:.2f} s ({:.0f} points/s)'.format(n, elapsed, n / elapsed)
+        
+        print 'max difference: {:.6f} m'.format(np.abs(single - batch).max() if n else 0)
@@ -0,0 +1,31 @@
+'''
+Created on Oct 18, 2026
+'''
+from django.core.management.base import BaseCommand
+from peil.models import Sensor, Latest
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Rebuild table with latest sensor values'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('-d','--device',
+            action='store',
+            dest='devid',
+            help='device id')
+
+    def handle(self, *args, **options):
+        query = Sensor.objects.all()
+        devid = options['devid']
+        if devid:
+            query = query.filter(device__devid=devid)
+        count = 0
+        for sensor in query:
+            msg = sensor.loramessage_set.order_by('time').last()
+            if msg:
+                msg.sensor = sensor
+                Latest.objects.update_or_create(sensor=sensor, defaults=Latest.values(msg))
+                count += 1
+            else:
+                Latest.objects.filter(sensor=sensor).delete()
+        print count, 'sensors updated'
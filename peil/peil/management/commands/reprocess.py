@@ -0,0 +1,64 @@
+'''
+Created on Oct 18, 2026
+'''
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+import time
+
+from peil.models import Uplink
+from peil.archive import reprocess
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Rebuild messages from the archive of original uplinks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-s','--source',
+            action='store',
+            dest='source',
+            choices=['ttn','kpn'],
+            help='only uplinks from this source')
+        parser.add_argument('-d','--device',
+            action='store',
+            dest='serial',
+            help='only uplinks of device with this serial')
+        parser.add_argument('--since',
+            action='store',
+            dest='since',
+            help='only uplinks received at or after this time (ISO 8601)')
+        parser.add_argument('--until',
+            action='store',
+            dest='until',
+            help='only uplinks received before this time (ISO 8601)')
+        parser.add_argument('-b','--batch',
+            action='store',
+            dest='batch',
+            type=int,
+            default=5000,
+            help='number of uplinks per transaction')
+
+    def handle(self, *args, **options):
+        query = Uplink.objects.all()
+        if options['source']:
+            query = query.filter(source=options['source'])
+        if options['serial']:
+            query = query.filter(serial=options['serial'])
+        if options['since']:
+            query = query.filter(received__gte=parse_datetime(options['since']))
+        if options['until']:
+            query = query.filter(received__lt=parse_datetime(options['until']))
+
+        start = time.time()
+        last = 0
+        uplinks = messages = 0
+        failed = []
+        while True:
+            # walk through the archive in order of primary key
+            batch = list(query.filter(pk__gt=last).order_by('pk')[:options['batch']])
+            if not batch:
+                break
+            last = batch[-1].pk
+            uplinks += len(batch)
+            messages += len(reprocess(batch, failed=failed))
+            elapsed = time.time() - start
+            print '{} uplinks, {} messages, {} failed ({:.0f} messages/s)'.format(uplinks, messages, len(failed), messages / elapsed if elapsed else 0)
@@ -0,0 +1,69 @@
+'''
+Created on Oct 18, 2026
+'''
+from django.core.management.base import BaseCommand
+from django.db.models import Min, Max
+from datetime import timedelta
+from peil.models import Sensor, Rollup
+from peil import rollup
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Update hourly and daily rollups of sensor values'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('-d','--device',
+            action='store',
+            dest='devid',
+            help='device id')
+        parser.add_argument('-b','--backfill',
+            action='store_true',
+            dest='backfill',
+            default=False,
+            help='recalculate all rollups instead of only the days since the last rollup')
+        parser.add_argument('-r','--repair',
+            action='store_true',
+            dest='repair',
+            default=False,
+            help='recalculate days where the number of messages in the rollups differs from the stored messages')
+        parser.add_argument('--days',
+            action='store',
+            type=int,
+            default=90,
+            dest='days',
+            help='number of days to process at once')
+
+    def handle(self, *args, **options):
+        query = Sensor.objects.all()
+        devid = options['devid']
+        if devid:
+            query = query.filter(device__devid=devid)
+        backfill = options['backfill']
+        step = timedelta(days=options['days'])
+        for sensor in query:
+            if options['repair']:
+                days = rollup.incomplete_days(sensor)
+                count = sum(rollup.update(sensor, day, day) for day in days)
+                print sensor.device, sensor, len(days), 'days repaired,', count, 'rollups'
+                continue
+            extent = sensor.loramessage_set.aggregate(first=Min('time'),last=Max('time'))
+            if extent['first'] is None:
+                continue
+            if backfill:
+                Rollup.objects.filter(sensor=sensor).delete()
+                Sensor.objects.filter(pk=sensor.pk).update(rollups_since=None)
+                start = extent['first']
+            else:
+                # start at watermark: the last day that has rollups
+                start = rollup.watermark(sensor) or extent['first']
+            first = start
+            count = 0
+            while True:
+                stop = min(start + step, extent['last'])
+                count += rollup.update(sensor, start, stop)
+                if stop >= extent['last']:
+                    break
+                start = stop
+            # rollups are complete from the first processed day on
+            rollup.extend_coverage(sensor, rollup.floor_day(first), rollup.floor_day(extent['last']))
+            print sensor.device, sensor, count, 'rollups'
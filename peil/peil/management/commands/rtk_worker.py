@@ -0,0 +1,48 @@
+'''
+Created on Oct 18, 2026
+'''
+from django.core.management.base import BaseCommand
+import logging
+
+from peil.postproc import Scheduler
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Run queued rtk postprocessing jobs in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once',
+            action='store_true',
+            dest='once',
+            default=False,
+            help='process until the queue is empty and exit')
+        parser.add_argument('-p','--processes',
+            action='store',
+            dest='processes',
+            type=int,
+            help='number of parallel jobs (default number of CPUs)')
+        parser.add_argument('-i','--interval',
+            action='store',
+            dest='interval',
+            type=float,
+            default=5.0,
+            help='seconds between checks for queued and completed jobs')
+        parser.add_argument('-t','--timeout',
+            action='store',
+            dest='timeout',
+            type=float,
+            default=3600.0,
+            help='seconds after which a job without result is marked as failed')
+        parser.add_argument('--requeue',
+            action='store_true',
+            dest='requeue',
+            default=False,
+            help='queue files again that were left running by a stopped worker')
+
+    def handle(self, *args, **options):
+        scheduler = Scheduler(options['processes'], timeout=options['timeout'])
+        if options['requeue']:
+            logger.debug('{} files queued again'.format(scheduler.requeue()))
+        scheduler.run(once=options['once'], interval=options['interval'])
@@ -6,15 +6,19 @@ Created on Apr 26, 2017
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from django.utils.dateparse import parse_datetime
+from requests.adapters import HTTPAdapter
+from multiprocessing.pool import ThreadPool
+import Queue
 import requests
+import json
 
 import logging
 from peil.models import Device, MESSAGES
-from peil.util import parse_payload
-from peil.fiware import Orion
+from peil.util import get_orion, update_devices
+from peil.ingest import parse_payloads
 logger = logging.getLogger(__name__)
 
-def download_ttn(devid,since):
+def download_ttn(devid,since,session=None,stream=False):
     """ download data from The Things Network """
     url = settings.TTN_URL + 'query'
     if devid:
@@ -27,32 +31,60 @@ def download_ttn(devid,since):
     logger.debug('url={}'.format(url))
     #logger.debug('headers={}'.format(headers))
     logger.debug('params={}'.format(params))
-    response = requests.get(url,params=params,headers=headers)
+    response = (session or requests).get(url,params=params,headers=headers,stream=stream)
     return response
 
-def parse_ttn(ttn):
-    """ parse json from ttn server """
-    try:
-        devid = ttn['device_id']
-        server_time = parse_datetime(ttn['time'])
-        message_type = ttn['type']
-        name = MESSAGES.get(message_type,str(message_type))
-        logger.debug('{},{},{}'.format(devid, server_time, name))
-    except Exception as e:
-        logger.error('Error parsing response {}\n{}'.format(ttn,e))
-        raise e
- 
-    device, created = Device.objects.update_or_create(devid=devid, defaults={'last_seen': server_time})
- 
-    if created:
-        logger.debug('device {} created'.format(devid))
-    
-    if settings.USE_ORION:
-        orion = Orion(settings.ORION_URL)
-    else:
-        orion = None
-        
-    parse_payload(device, server_time, ttn, orion)
+def iterjson(response, chunk_size=65536):
+    """ generates the elements of a json array in a streamed response without reading the whole response """
+    decoder = json.JSONDecoder()
+    response.encoding = response.encoding or 'utf-8'
+    buf = u''
+    for chunk in response.iter_content(chunk_size, decode_unicode=True):
+        buf += chunk
+        pos = 0
+        while True:
+            # skip whitespace, separators and the brackets of the array
+            while pos < len(buf) and buf[pos] in u' \t\r\n,[]':
+                pos += 1
+            if pos >= len(buf):
+                break
+            try:
+                obj, pos2 = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # element is not complete yet
+                break
+            pos = pos2
+            if obj is not None:
+                yield obj
+        buf = buf[pos:]
+    if buf.strip():
+        raise ValueError('Incomplete response: {}'.format(buf[:100]))
+
+def parse_ttns(ttns, orion=None):
+    """ parse a batch of json rows from ttn server """
+    rows = []
+    last_seen = {}
+    for row, ttn in enumerate(ttns,1):
+        try:
+            devid = ttn['device_id']
+            server_time = parse_datetime(ttn['time'])
+            message_type = ttn['type']
+            name = MESSAGES.get(message_type,str(message_type))
+            logger.debug('{},{},{}'.format(devid, server_time, name))
+        except Exception as e:
+            logger.error('Error parsing response {}\n{}'.format(ttn,e))
+            print row, e
+            continue
+        key = (devid,)
+        rows.append((key, server_time, ttn))
+        if key not in last_seen or last_seen[key] < server_time:
+            last_seen[key] = server_time
+
+    devices = update_devices(last_seen, fields=('devid',))
+    return parse_payloads([(devices[key], server_time, ttn) for key, server_time, ttn in rows], orion)
+
+# marks the end of the download of a device
+DONE = object()
 
 class Command(BaseCommand):
     help = 'Download from The Things Network'
@@ -68,6 +100,34 @@ class Command(BaseCommand):
                 dest='since',
                 help='Download since, where since is something like 1h, 6h or 1d')
 
+        parser.add_argument('-w','--workers',
+                action='store',
+                type=int,
+                default=4,
+                dest='workers',
+                help='number of devices to download at the same time')
+
+        parser.add_argument('-b','--batch',
+                action='store',
+                type=int,
+                default=1000,
+                dest='batch',
+                help='number of messages per batch')
+
+    def store(self, ttns, orion):
+        """ store a batch of messages. When that fails, store them one by one """
+        try:
+            return len(parse_ttns(ttns, orion))
+        except Exception:
+            logger.exception('Error storing batch of {} messages'.format(len(ttns)))
+        count = 0
+        for ttn in ttns:
+            try:
+                count += len(parse_ttns([ttn], orion))
+            except Exception:
+                logger.exception('Error storing message {}'.format(ttn))
+        return count
+
     def handle(self, *args, **options):
         devid = options.get('devid')
         if devid == 'all':
@@ -75,23 +135,52 @@ class Command(BaseCommand):
         else:
             devices = [devid]
         since = options.get('since','1h')
-        for dev in devices:
-            print dev
-            response = download_ttn(dev, since)
-            if not response.ok:
-                logger.error('TTN server responds with code={}: {}'.format(response.status_code, response.reason))
-                continue
-            logger.debug('received {} bytes'.format(len(response.content)))
+        workers = max(1, options.get('workers'))
+        size = options.get('batch')
+        orion = get_orion()
+
+        # downloads run in a pool of threads sharing one session, the messages are stored in this thread
+        session = requests.Session()
+        session.mount(settings.TTN_URL, HTTPAdapter(pool_connections=workers, pool_maxsize=workers))
+        queue = Queue.Queue(maxsize=workers*4)
+
+        def download(dev):
             try:
-                ttns = response.json()
-            except Exception as e:
-                logger.error('Error parsing response\n{}'.format(response.text))
+                response = download_ttn(dev, since, session, stream=True)
+                if not response.ok:
+                    logger.error('TTN server responds with code={}: {}'.format(response.status_code, response.reason))
+                    return
+                batch = []
+                for ttn in iterjson(response):
+                    batch.append(ttn)
+                    if len(batch) >= size:
+                        queue.put(batch)
+                        batch = []
+                if batch:
+                    queue.put(batch)
+            except Exception:
+                logger.exception('Error downloading messages for {}'.format(dev))
+            finally:
+                queue.put(DONE)
+
+        pool = ThreadPool(workers)
+        pool.map_async(download, devices)
+        pool.close()
+
+        pending = len(devices)
+        ttns = []
+        received = stored = 0
+        while pending:
+            item = queue.get()
+            if item is DONE:
+                pending -= 1
                 continue
-            row = 0
-            for ttn in ttns:
-                row += 1
-                try:
-                    parse_ttn(ttn)
-                except Exception as e:
-                    print row, e
-                    continue
+            ttns.extend(item)
+            received += len(item)
+            if len(ttns) >= size:
+                stored += self.store(ttns, orion)
+                ttns = []
+        if ttns:
+            stored += self.store(ttns, orion)
+        pool.join()
+        print '{} messages received from {} devices, {} stored'.format(received, len(devices), stored)
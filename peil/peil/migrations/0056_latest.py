@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('peil', '0055_auto_20171206_1013'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Latest',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time', models.DateTimeField(verbose_name=b'tijdstip')),
+                ('fields', models.TextField(help_text=b'inhoud van het bericht als json', verbose_name=b'ruwe waardes')),
+                ('value', models.FloatField(help_text=b'gekalibreerde waarde', null=True, verbose_name=b'waarde')),
+                ('message', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='peil.LoraMessage', verbose_name=b'bericht')),
+                ('message_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType', verbose_name=b'berichttype')),
+                ('sensor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='latest', to='peil.Sensor', verbose_name=b'sensor')),
+            ],
+            options={
+                'verbose_name': 'Laatste waarde',
+                'verbose_name_plural': 'Laatste waardes',
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 13:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peil', '0056_latest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Rollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.CharField(choices=[(b'H', b'uur'), (b'D', b'dag')], max_length=1, verbose_name=b'interval')),
+                ('time', models.DateTimeField(help_text=b'begin van het interval', verbose_name=b'tijdstip')),
+                ('count', models.PositiveIntegerField(verbose_name=b'aantal berichten')),
+                ('mean', models.FloatField(null=True, verbose_name=b'gemiddelde')),
+                ('min', models.FloatField(null=True, verbose_name=b'minimum')),
+                ('max', models.FloatField(null=True, verbose_name=b'maximum')),
+                ('raw', models.TextField(help_text=b'gemiddelde, minimum en maximum van de ruwe waardes als json', verbose_name=b'ruwe waardes')),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='peil.Sensor', verbose_name=b'sensor')),
+            ],
+            options={
+                'verbose_name': 'Samenvatting',
+                'verbose_name_plural': 'Samenvattingen',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='rollup',
+            unique_together=set([('sensor', 'interval', 'time')]),
+        ),
+    ]
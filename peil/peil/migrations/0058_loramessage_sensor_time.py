@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, transaction
+from django.db.models import Count, Min
+
+def remove_duplicates(apps, schema_editor):
+    ''' keep the first stored message when there are more messages of a sensor with the same time '''
+    LoraMessage = apps.get_model('peil', 'LoraMessage')
+    db = schema_editor.connection.alias
+    messages = LoraMessage.objects.using(db)
+    duplicates = messages.values('sensor_id','time').annotate(count=Count('id'), first=Min('id')).filter(count__gt=1)
+    for dup in duplicates.iterator():
+        with transaction.atomic(using=db):
+            # delete() takes care of the child tables and of the references in the latest value table
+            messages.filter(sensor_id=dup['sensor_id'], time=dup['time']).exclude(pk=dup['first']).delete()
+
+class Migration(migrations.Migration):
+    ''' Adds a unique index on (sensor_id, time) to the LoRa message table.
+        The index is built concurrently, so this migration does not lock the table for writes and is not atomic.
+    '''
+    atomic = False
+
+    dependencies = [
+        ('peil', '0057_rollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS peil_loramessage_sensor_id_time_uniq ON peil_loramessage (sensor_id, time)',
+                    'DROP INDEX CONCURRENTLY IF EXISTS peil_loramessage_sensor_id_time_uniq'),
+                migrations.RunSQL(
+                    'ALTER TABLE peil_loramessage ADD CONSTRAINT peil_loramessage_sensor_id_time_uniq UNIQUE USING INDEX peil_loramessage_sensor_id_time_uniq',
+                    'ALTER TABLE peil_loramessage DROP CONSTRAINT IF EXISTS peil_loramessage_sensor_id_time_uniq'),
+                migrations.RunSQL('ANALYZE peil_loramessage', migrations.RunSQL.noop),
+            ],
+            state_operations=[
+                migrations.AlterUniqueTogether(
+                    name='loramessage',
+                    unique_together=set([('sensor', 'time')]),
+                ),
+            ]),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 14:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peil', '0058_loramessage_sensor_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrionUpdate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity_id', models.CharField(max_length=100, verbose_name=b'entity')),
+                ('entity_type', models.CharField(max_length=40, verbose_name=b'type')),
+                ('attributes', models.TextField(help_text=b'NGSI v2 attributen als json', verbose_name=b'attributen')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name=b'aangemaakt')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name=b'pogingen')),
+                ('error', models.TextField(blank=True, verbose_name=b'foutmelding')),
+            ],
+            options={
+                'verbose_name': 'Orion update',
+                'verbose_name_plural': 'Orion updates',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 15:00
+from __future__ import unicode_literals
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peil', '0059_orionupdate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Uplink',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[(b'ttn', b'The Things Network'), (b'kpn', b'KPN')], max_length=3, verbose_name=b'bron')),
+                ('serial', models.CharField(blank=True, max_length=40, verbose_name=b'MAC-adres')),
+                ('received', models.DateTimeField(verbose_name=b'ontvangen')),
+                ('body', models.BinaryField(help_text=b'met zlib gecomprimeerde inhoud van het bericht', verbose_name=b'inhoud')),
+            ],
+            options={
+                'verbose_name': 'Uplink',
+                'verbose_name_plural': 'Uplinks',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='uplink',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['received'], name='peil_uplink_received_brin'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 16:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peil', '0060_uplink'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingUplink',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name=b'pogingen')),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now, verbose_name=b'volgende poging')),
+                ('error', models.TextField(blank=True, verbose_name=b'foutmelding')),
+                ('dead', models.BooleanField(default=False, verbose_name=b'opgegeven')),
+                ('uplink', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='peil.Uplink', verbose_name=b'uplink')),
+            ],
+            options={
+                'verbose_name': 'Wachtende uplink',
+                'verbose_name_plural': 'Wachtende uplinks',
+            },
+        ),
+    ]
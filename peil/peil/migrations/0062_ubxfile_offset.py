@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 17:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peil', '0061_pendinguplink'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ubxfile',
+            name='offset',
+            field=models.BigIntegerField(default=0, help_text='Aantal bytes dat is gescand voor begin en einde', verbose_name='verwerkt'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 18:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peil', '0062_ubxfile_offset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ubxfile',
+            name='status',
+            field=models.CharField(blank=True, choices=[('queued', 'In wachtrij'), ('running', 'Bezig'), ('done', 'Gereed'), ('failed', 'Mislukt')], max_length=10, verbose_name='postprocessing'),
+        ),
+        migrations.AddField(
+            model_name='ubxfile',
+            name='queued',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='in wachtrij'),
+        ),
+        migrations.AddField(
+            model_name='ubxfile',
+            name='started',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='gestart'),
+        ),
+        migrations.AddField(
+            model_name='ubxfile',
+            name='finished',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='voltooid'),
+        ),
+        migrations.AddField(
+            model_name='ubxfile',
+            name='error',
+            field=models.TextField(blank=True, verbose_name='foutmelding'),
+        ),
+    ]
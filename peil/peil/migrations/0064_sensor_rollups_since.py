@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 19:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peil', '0063_ubxfile_post_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensor',
+            name='rollups_since',
+            field=models.DateTimeField(blank=True, help_text='samenvattingen zijn compleet vanaf dit tijdstip', null=True, verbose_name='samenvattingen vanaf'),
+        ),
+    ]
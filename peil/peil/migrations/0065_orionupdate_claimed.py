@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 20:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peil', '0064_sensor_rollups_since'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orionupdate',
+            name='claimed',
+            field=models.DateTimeField(blank=True, help_text='tijdstip waarop een publisher de update is gaan versturen', null=True, verbose_name='geclaimd'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 21:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peil', '0065_orionupdate_claimed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orionupdate',
+            name='next_attempt',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='volgende poging'),
+        ),
+    ]
@@ -5,15 +5,20 @@ Created on Apr 25, 2017
 '''
 from django.db import models, transaction
 from django.contrib.gis.db import models as geo
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.indexes import BrinIndex
 from polymorphic.models import PolymorphicModel
 from sorl.thumbnail import ImageField
 import numpy as np
+import pandas as pd
 import os
 import logging
 import calib
 import json
+import zlib
 from django.utils import timezone
 from django.urls.base import reverse
+from django.apps import apps
 
 logger = logging.getLogger(__name__)
 
@@ -82,8 +87,22 @@ class Device(models.Model):
             return 'grey'
         
     def last_survey(self):    
+        """ returns the last survey. Use prefetch_surveys for lists of devices """
+        if hasattr(self, '_last_survey'):
+            return self._last_survey
         return self.survey_set.order_by('time').last()
 
+    @staticmethod
+    def prefetch_surveys(devices):
+        """ read the last survey of a list of devices with one query """
+        devices = {d.pk: d for d in devices}
+        for device in devices.values():
+            device._last_survey = None
+        for survey in Survey.objects.filter(device_id__in=devices.keys()).order_by('device_id','-time').distinct('device_id'):
+            device = devices[survey.device_id]
+            survey.device = device
+            device._last_survey = survey
+
     def sensor_names(self):
         """ returns comma separated list of sensor names """
         return ', '.join(self.sensor_set.distinct('ident').order_by('ident').values_list('ident',flat=True))
@@ -97,14 +116,43 @@ class Device(models.Model):
         self.sensor_set.all().delete()
         super(Device,self).delete()
         
+    def latest_values(self):
+        """ returns latest values of all sensors of this device. Reads the latest value table once per device instance """
+        if not hasattr(self, '_latest'):
+            self._latest = list(Latest.objects.filter(sensor__device=self).select_related('sensor'))
+            for latest in self._latest:
+                latest.sensor.device = self
+        return self._latest
+
+    @staticmethod
+    def prefetch_latest(devices):
+        """ read latest values of a list of devices with one query """
+        devices = {d.pk: d for d in devices}
+        for device in devices.values():
+            device._latest = []
+        for latest in Latest.objects.filter(sensor__device_id__in=devices.keys()).select_related('sensor'):
+            device = devices[latest.sensor.device_id]
+            latest.sensor.device = device
+            device._latest.append(latest)
+
+    def clear_latest(self):
+        """ forget latest values read by latest_values() """
+        self.__dict__.pop('_latest', None)
+
+    def get_latest(self, ident, position=None):
+        """ returns latest value of sensor with given ident (and position) or None """
+        ident = ident.lower()
+        for latest in self.latest_values():
+            sensor = latest.sensor
+            if sensor.ident.lower() == ident and (position is None or sensor.position == position):
+                return latest
+        return None
+        
     def battery_status(self):
         from peil import util
-        sensor = self.get_sensor('Batterij',position=0)
-        if sensor:
-            msg = sensor.last_message()
-            if msg:
-                level = sensor.value(msg)
-                return util.battery_status(level)
+        latest = self.get_latest('Batterij',position=0)
+        if latest and latest.value is not None:
+            return util.battery_status(latest.value)
         return None
     
     def battery_level(self):
@@ -136,7 +184,7 @@ class Device(models.Model):
             return float(self.last_survey().altitude)
         except:
             try:
-                x,y,z = self.get_sensor('GPS').last_message().NAPvalue()
+                x,y,z = self.get_latest('GPS').to_message().NAPvalue()
                 return z
             except:
                 return None
@@ -150,35 +198,8 @@ class Device(models.Model):
 
     def current_location(self, hacc=10000):
         ''' returns current location '''
-        from django.contrib.gis.gdal.srs import CoordTransform, SpatialReference
-
-        s = self.survey_set.last()
-        if s:
-            pnt = s.location
-            wgs84 = SpatialReference(4326)
-            rdnew = SpatialReference(28992)
-            trans = CoordTransform(rdnew,wgs84)
-            pnt.transform(trans)
-            return {'id': self.id, 'name': self.displayname, 'lon': pnt.x, 'lat': pnt.y}
-        else:
-            # get location from on-board GPS
-            # select only valid fixes (with hacc > 0)
-            g = self.get_sensor('GPS').loramessage_set.filter(locationmessage__hacc__gt=0).order_by('time')
-            if g:
-                if hacc:
-                    # filter messages on maximum hacc
-                    g = g.filter(hacc__lt=hacc)
-                    
-                # use last valid gps message
-                g = g.last()
-    
-                if g.lon > 40*1e7 and g.lat < 10*1e7:
-                    # verwisseling lon/lat?
-                    t = g.lon
-                    g.lon = g.lat
-                    g.lat = t
-                    return {'id': self.id, 'name': self.displayname, 'lon': g.lon*1e-7, 'lat': g.lat*1e-7, 'msl': g.msl*1e-3, 'hacc': g.hacc*1e-3, 'vacc': g.vacc*1e-3, 'time': g.time}
-        return {}
+        from peil.locations import current_locations
+        return current_locations(hacc, device_ids=[self.pk]).get(self.pk, {})
     
     def __unicode__(self):
         return self.displayname
@@ -240,6 +261,20 @@ def rounds(x, sig=2):
     """
     return round(x, sig-int(floor(log10(abs(x))))-1)
 
+def rounds_array(x, sig=2):
+    """
+    @summary: round array of floating point numbers to significant digits
+    @param x: array of floating point values
+    @param sig: number of significant digits (default=2)
+    @return: array with values rounded to `sig` significant digits. Zeros and non-finite values become NaN   
+    """
+    x = np.asarray(x, dtype=float)
+    result = np.full_like(x, np.nan)
+    valid = np.isfinite(x) & (x != 0)
+    factor = 10.0 ** (sig - np.floor(np.log10(np.abs(x[valid]))) - 1)
+    result[valid] = np.round(x[valid] * factor) / factor
+    return result
+
 class Sensor(PolymorphicModel):
     """ Sensor in a peilstok """
 
@@ -257,6 +292,15 @@ class Sensor(PolymorphicModel):
 
     """ unit of calibrated values """
     unit = models.CharField(max_length = 10, default='-', verbose_name='eenheid')
+
+    """ hourly and daily rollups are complete from this time on """
+    rollups_since = models.DateTimeField(null=True,blank=True,verbose_name='samenvattingen vanaf',help_text='samenvattingen zijn compleet vanaf dit tijdstip')
+
+    """ name of LoraMessage subclass sent by this type of sensor """
+    message_type = 'LoraMessage'
+
+    """ raw values equal to or above this limit are invalid """
+    adc_limit = None
     
     def message_count(self):
         """
@@ -273,7 +317,15 @@ class Sensor(PolymorphicModel):
         return nap - self.distance*1e-3
     
     def last_message(self):
-        return self.loramessage_set.order_by('time').last()
+        """ returns last message from latest value table. Use select_related('latest') for lists of sensors """
+        try:
+            latest = self.latest
+        except Latest.DoesNotExist:
+            latest = None
+        if latest is None or latest.message_id is None:
+            # no latest value or the message has been deleted
+            return self.loramessage_set.order_by('time').last()
+        return latest.to_message()
     last_message.short_description = 'Laatste bericht'
 
     def first_message(self):
@@ -306,6 +358,48 @@ class Sensor(PolymorphicModel):
             queryset = q.all() 
         for m in queryset:
             yield m.to_dict()
+
+    def message_model(self):
+        """ returns the LoraMessage subclass of messages sent by this sensor """
+        return apps.get_model('peil', self.message_type)
+
+    def frame(self, start=None, stop=None, fields=None):
+        """
+        @summary: query raw message values in one go from the table of the message model, without creating model instances
+        @param start: optional start time (inclusive)
+        @param stop: optional stop time (exclusive)
+        @param fields: list of field names (default all fields of the message model)
+        @return: Pandas dataframe with raw values indexed on time 
+        """
+        model = self.message_model()
+        if fields is None:
+            fields = model.data_fields()
+        else:
+            fields = list(fields)
+        query = model.objects.non_polymorphic().filter(sensor_id=self.pk)
+        if start:
+            query = query.filter(time__gte=start)
+        if stop:
+            query = query.filter(time__lt=stop)
+        rows = query.order_by('time').values_list('time', *fields)
+        df = pd.DataFrame.from_records(list(rows), columns=['time'] + fields)
+        df['time'] = pd.to_datetime(df['time'], utc=True)
+        return df.set_index('time')
+
+    def calibrate_frame(self, df):
+        """ vectorized version of value(): returns array with calibrated values for dataframe with raw message values.
+        Sensors without calibration have no values """
+        return np.full(len(df), np.nan)
+
+    def linear(self):
+        """ returns (raw field, offset, scale) when calibrated values are a linear function of one raw field, otherwise None.
+        Linear calibrations can be applied after aggregating raw values in the database """
+        return None
+
+    def series(self, start=None, stop=None):
+        """ returns Pandas series with calibrated values """
+        df = self.frame(start, stop)
+        return pd.Series(self.calibrate_frame(df), index=df.index, dtype=float)
             
     def __unicode__(self):
         return self.ident
@@ -318,21 +412,34 @@ class Sensor(PolymorphicModel):
         
 class PressureSensor(Sensor):
 
+    message_type = 'PressureMessage'
+    adc_limit = 4096
+
     offset = models.FloatField(default = 0.0)
     scale = models.FloatField(default = 1.0)
 
     def value(self, m):
         """ calculates pressure in hPa from raw ADC value in message """
-        if m.adc < 4096:
+        if m.adc < self.adc_limit:
             return round(self.offset + m.adc * self.scale,2)
         else:
             return None
 
+    def calibrate_frame(self, df):
+        adc = df['adc'].values.astype(float)
+        with np.errstate(invalid='ignore'):
+            return np.where(adc < self.adc_limit, np.round(self.offset + adc * self.scale, 2), np.nan)
+
+    def linear(self):
+        return ('adc', self.offset, self.scale)
+
     class Meta:
         verbose_name = 'Druksensor'
         verbose_name_plural = 'druksensoren'
 
 class ECSensor(Sensor):
+
+    message_type = 'ECMessage'
     
     tempfactor = models.FloatField(default=0.0246534878,verbose_name = 'factor', help_text = 'factor voor conversie naar 25 oC')
     adc1_coef = models.CharField(max_length=200,verbose_name ='Coefficienten ring1', default=calib.ADC1EC)
@@ -341,18 +448,33 @@ class ECSensor(Sensor):
     adc2_limits = models.CharField(max_length=50,verbose_name='bereik ring2',default=calib.ADC2EC_LIMITS)
     ec_range = models.CharField(max_length=50,verbose_name = 'bereik', default=calib.EC_RANGE)
 
+    def calibration(self):
+        """ returns parsed calibration coefficients. The result is cached on this instance until one of the json fields changes """
+        key = (self.ec_range, self.adc1_limits, self.adc2_limits, self.adc1_coef, self.adc2_coef)
+        cached = getattr(self, '_calibration', None)
+        if cached is None or cached[0] != key:
+            cached = (key, {
+                'range': json.loads(self.ec_range),
+                'limits1': json.loads(self.adc1_limits),
+                'limits2': json.loads(self.adc2_limits),
+                'coef1': json.loads(self.adc1_coef),
+                'coef2': json.loads(self.adc2_coef),
+                })
+            self._calibration = cached
+        return cached[1]
+
+    @staticmethod
+    def rational(x, p0, p1, p2, q1):
+        """ evaluates rational function (p0*x^2 + p1*x + p2) / (x + q1) """
+        return np.polyval([p0, p1, p2], x) / np.polyval([1, q1], x)
+
     def EC(self,adc1,adc2):
         """ Calculates EC from raw ADC values """
 
-        def rat1(x, p, q):
-            return np.polyval(p, x) / np.polyval([1] + q, x)
-        
-        def rat2(x, p0, p1, p2, q1):
-            return rat1(x, [p0, p1, p2], [q1])
-
-        emin,emax = json.loads(self.ec_range)
-        min1,max1 = json.loads(self.adc1_limits)
-        min2,max2 = json.loads(self.adc2_limits)
+        cal = self.calibration()
+        emin,emax = cal['range']
+        min1,max1 = cal['limits1']
+        min2,max2 = cal['limits2']
         sign = ''
         if adc1 >= max1:
             # out of range, dry?
@@ -360,7 +482,7 @@ class ECSensor(Sensor):
             ec = None
         else:
             if adc1 >= min1:
-                ec1 = rat2(adc1, *json.loads(self.adc1_coef))
+                ec1 = self.rational(adc1, *cal['coef1'])
                 w1 = adc1 - min1
             else:
                 ec1 = emax
@@ -370,7 +492,7 @@ class ECSensor(Sensor):
                 w2 = 1
             elif adc2 <= max2:
                 # use adc2 only
-                ec2 = rat2(adc2, *json.loads(self.adc2_coef))
+                ec2 = self.rational(adc2, *cal['coef2'])
                 w2 = max2 - adc2
             else:
                 ec2 = emin
@@ -389,6 +511,39 @@ class ECSensor(Sensor):
         else:
             return ec * (1.0 + (25.0 - temp/100.0) * self.tempfactor) if ec else None
 
+    def EC_array(self, adc1, adc2):
+        """ Calculates EC in mS/cm from arrays of raw ADC values. Returns NaN where EC can not be calculated """
+        cal = self.calibration()
+        emin,emax = cal['range']
+        min1,max1 = cal['limits1']
+        min2,max2 = cal['limits2']
+        adc1 = np.asarray(adc1, dtype=float)
+        adc2 = np.asarray(adc2, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            use1 = adc1 >= min1
+            ec1 = np.where(use1, self.rational(adc1, *cal['coef1']), emax)
+            w1 = np.where(use1, adc1 - min1, 0.0)
+            ranges = [adc2 < min2, adc2 <= max2]
+            ec2 = np.select(ranges, [emax, self.rational(adc2, *cal['coef2'])], emin)
+            w2 = np.select(ranges, [1.0, max2 - adc2], 0.0)
+            sumw = w1 + w2
+            ec = (ec1*w1 + ec2*w2) / sumw
+        # out of range (dry?) or no valid weights
+        ec[(adc1 >= max1) | (sumw == 0) | (ec == 0)] = np.nan
+        return ec * 1e-3 # to mS/cm
+
+    def EC25_array(self, adc1, adc2, temp):
+        """ Calculates EC at 25 oC from arrays of raw ADC values and temperature in 0.01 degrees C """
+        temp = np.asarray(temp, dtype=float)
+        return self.EC_array(adc1, adc2) * (1.0 + (25.0 - temp/100.0) * self.tempfactor)
+
+    def calibrate(self, adc1, adc2, temp):
+        """ vectorized version of value(): returns array of EC25 values rounded to 3 significant digits """ 
+        return rounds_array(self.EC25_array(adc1, adc2, temp), 3)
+
+    def calibrate_frame(self, df):
+        return self.calibrate(df['adc1'].values, df['adc2'].values, df['temperature'].values)
+
     def value(self, m):
         ec = self.EC25(m.adc1, m.adc2, m.temperature)
         return rounds(ec,3) if ec else None # 3 significant digits
@@ -398,14 +553,24 @@ class ECSensor(Sensor):
         verbose_name_plural = 'EC-sensoren'
 
 class GNSS_Sensor(Sensor):
+
+    message_type = 'LocationMessage'
+
     class Meta:
         verbose_name = 'GPS'
         verbose_name_plural = 'GPS'
 
     def value(self,m):
         return (m.lon*1e-7, m.lat*1e-7, round(m.alt*1e-3,3))
+
+    def calibrate_frame(self, df):
+        """ positions have no scalar calibrated value """
+        return super(GNSS_Sensor, self).calibrate_frame(df)
         
 class AngleSensor(Sensor):
+
+    message_type = 'InclinationMessage'
+
     class Meta:
         verbose_name = 'Inclinometer'
         verbose_name_plural =  'Inclinometers'
@@ -413,7 +578,16 @@ class AngleSensor(Sensor):
     def value(self, m):
         return m.angle
 
+    def calibrate_frame(self, df):
+        return df['angle'].values
+
+    def linear(self):
+        return ('angle', 0.0, 1.0)
+
 class BatterySensor(Sensor):
+
+    message_type = 'StatusMessage'
+
     class Meta:
         verbose_name = 'Batterijspanning'
         verbose_name_plural =  'Batterijspanning'
@@ -421,6 +595,12 @@ class BatterySensor(Sensor):
     def value(self, m):
         return m.battery
 
+    def calibrate_frame(self, df):
+        return df['battery'].values
+
+    def linear(self):
+        return ('battery', 0.0, 1.0)
+
 class LoraMessage(PolymorphicModel):
     """ Base class for all LoRa messages sent by a sensor """
     
@@ -441,11 +621,18 @@ class LoraMessage(PolymorphicModel):
     
     def to_dict(self):
         return {'time': self.time}
+
+    @classmethod
+    def data_fields(cls):
+        ''' returns names of the fields with raw values of this message type '''
+        return [f.name for f in cls._meta.local_concrete_fields if not f.primary_key]
       
     class Meta:
         verbose_name = 'LoRa bericht'
         verbose_name_plural = 'LoRa berichten'
         ordering = ['-time']
+        # one message per sensor per time. The index is also used for looking up messages of a sensor by time
+        unique_together = ('sensor', 'time')
         
 class ECMessage(LoraMessage):
     """ Contains data from an EC sensor """
@@ -551,26 +738,157 @@ class StatusMessage(LoraMessage):
         verbose_name = 'Batterijmeting'
         verbose_name_plural = 'Batterijmetingen'
 
-# class Latest(models.Model):
-#     ''' Latest valid measurements for a device '''
-#     device = models.ForeignKey(Device,verbose_name='peilstok')
-#     time = models.DateTimeField(verbose_name='tijdstip')
-#     measurement = models.CharField(max_length = 20,verbose_name='meting')
-#     value = models.CharField(max_length = 20,verbose_name='waarde')
-#     unit = models.CharField(max_length = 20,verbose_name='eenheid')
-# 
-#     class Meta:
-#         verbose_name = 'Laatste waarde'
-#         verbose_name_plural = 'Laatste waardes'
-#         unique_together = ('device', 'measurement')
-#     
-#     def __unicode__(self):
-#         return '{} {}'.format(self.device, self.measurement)
-            
+class Latest(models.Model):
+    ''' Latest message of a sensor, maintained at ingest '''
+    sensor = models.OneToOneField(Sensor,related_name='latest',verbose_name='sensor')
+    message = models.ForeignKey(LoraMessage,null=True,on_delete=models.SET_NULL,related_name='+',verbose_name='bericht')
+    message_type = models.ForeignKey(ContentType,verbose_name='berichttype')
+    time = models.DateTimeField(verbose_name='tijdstip')
+    fields = models.TextField(verbose_name='ruwe waardes',help_text='inhoud van het bericht als json')
+    value = models.FloatField(null=True,verbose_name='waarde',help_text='gekalibreerde waarde')
+
+    @staticmethod
+    def values(msg):
+        ''' returns field values for the latest value of the sensor of message msg '''
+        fields = msg.to_dict()
+        fields.pop('time')
+        try:
+            value = msg.sensor.value(msg)
+        except Exception:
+            value = None
+        return {
+            'message_id': msg.pk,
+            'message_type': ContentType.objects.get_for_model(msg, for_concrete_model=False),
+            'time': msg.time,
+            'fields': json.dumps(fields),
+            'value': value if isinstance(value, (int, long, float)) else None
+            }
+    
+    def to_message(self):
+        ''' returns (unsaved) message instance with the raw values '''
+        cls = ContentType.objects.get_for_id(self.message_type_id).model_class()
+        fields = json.loads(self.fields)
+        return cls(pk=self.message_id, sensor=self.sensor, time=self.time, **fields)
+
+    def __unicode__(self):
+        return '{} {}'.format(self.sensor, self.time)
+
+    class Meta:
+        verbose_name = 'Laatste waarde'
+        verbose_name_plural = 'Laatste waardes'
+
+from django.db.models.signals import post_delete
+
+@receiver(post_delete, sender=LoraMessage)
+def loramessage_delete(sender, instance, **kwargs):
+    ''' rebuild the latest value of the sensor when its latest message is deleted (the foreign key has been set to null) '''
+    if not Latest.objects.filter(sensor_id=instance.sensor_id, message__isnull=True).exists():
+        return
+    msg = LoraMessage.objects.filter(sensor_id=instance.sensor_id).order_by('time').last()
+    if msg is None:
+        Latest.objects.filter(sensor_id=instance.sensor_id).delete()
+    else:
+        Latest.objects.filter(sensor_id=instance.sensor_id).update(**Latest.values(msg))
+
+ROLLUP_CHOICES = (
+    ('H', 'uur'),
+    ('D', 'dag'),
+    )
+
+class Rollup(models.Model):
+    ''' Statistics of the messages of a sensor per hour or per day '''
+    sensor = models.ForeignKey(Sensor,verbose_name='sensor')
+    interval = models.CharField(max_length=1,choices=ROLLUP_CHOICES,verbose_name='interval')
+    time = models.DateTimeField(verbose_name='tijdstip',help_text='begin van het interval')
+    count = models.PositiveIntegerField(verbose_name='aantal berichten')
+    mean = models.FloatField(null=True,verbose_name='gemiddelde')
+    min = models.FloatField(null=True,verbose_name='minimum')
+    max = models.FloatField(null=True,verbose_name='maximum')
+    raw = models.TextField(verbose_name='ruwe waardes',help_text='gemiddelde, minimum en maximum van de ruwe waardes als json')
+
+    def raw_stats(self):
+        return json.loads(self.raw)
+
+    def __unicode__(self):
+        return '{} {} {}'.format(self.sensor, self.get_interval_display(), self.time)
+
+    class Meta:
+        verbose_name = 'Samenvatting'
+        verbose_name_plural = 'Samenvattingen'
+        unique_together = ('sensor', 'interval', 'time')
+
+class OrionUpdate(models.Model):
+    ''' Pending update of an entity in the Orion Context Broker (outbox). Rows are removed when the update has been published '''
+    entity_id = models.CharField(max_length=100,verbose_name='entity')
+    entity_type = models.CharField(max_length=40,verbose_name='type')
+    attributes = models.TextField(verbose_name='attributen',help_text='NGSI v2 attributen als json')
+    created = models.DateTimeField(auto_now_add=True,verbose_name='aangemaakt')
+    attempts = models.PositiveIntegerField(default=0,verbose_name='pogingen')
+    claimed = models.DateTimeField(null=True,blank=True,verbose_name='geclaimd',help_text='tijdstip waarop een publisher de update is gaan versturen')
+    next_attempt = models.DateTimeField(default=timezone.now,verbose_name='volgende poging')
+    error = models.TextField(blank=True,verbose_name='foutmelding')
+
+    def attrs(self):
+        return json.loads(self.attributes)
+
+    def __unicode__(self):
+        return '{} {}'.format(self.entity_type, self.entity_id)
+
+    class Meta:
+        verbose_name = 'Orion update'
+        verbose_name_plural = 'Orion updates'
+
+UPLINK_SOURCES = (
+    ('ttn', 'The Things Network'),
+    ('kpn', 'KPN'),
+    )
+
+class Uplink(models.Model):
+    ''' Original uplink as received from TTN or KPN, for replay and reprocessing. Append only '''
+    source = models.CharField(max_length=3,choices=UPLINK_SOURCES,verbose_name='bron')
+    serial = models.CharField(max_length=40,blank=True,verbose_name='MAC-adres')
+    received = models.DateTimeField(verbose_name='ontvangen')
+    body = models.BinaryField(verbose_name='inhoud',help_text='met zlib gecomprimeerde inhoud van het bericht')
+
+    def data(self):
+        ''' returns original content of the uplink '''
+        return zlib.decompress(bytes(self.body))
+
+    def __unicode__(self):
+        return '{} {} {}'.format(self.source, self.serial, self.received)
+
+    class Meta:
+        verbose_name = 'Uplink'
+        verbose_name_plural = 'Uplinks'
+        # rows are appended in order of time, a block range index is very small and fast enough
+        indexes = [BrinIndex(fields=['received'], name='peil_uplink_received_brin')]
+
+class PendingUplink(models.Model):
+    ''' Uplink waiting to be processed by manage.py ingest_worker. Uplinks that failed too often stay as dead letters '''
+    uplink = models.OneToOneField(Uplink,on_delete=models.CASCADE,verbose_name='uplink')
+    attempts = models.PositiveIntegerField(default=0,verbose_name='pogingen')
+    next_attempt = models.DateTimeField(default=timezone.now,verbose_name='volgende poging')
+    error = models.TextField(blank=True,verbose_name='foutmelding')
+    dead = models.BooleanField(default=False,verbose_name='opgegeven')
+
+    def __unicode__(self):
+        return unicode(self.uplink)
+
+    class Meta:
+        verbose_name = 'Wachtende uplink'
+        verbose_name_plural = 'Wachtende uplinks'
+
 # --------------------------------------------------------------------------------------------------------------
 # GPS and RTK stuff
 # --------------------------------------------------------------------------------------------------------------
 
+POST_STATUS = (
+    ('queued', 'In wachtrij'),
+    ('running', 'Bezig'),
+    ('done', 'Gereed'),
+    ('failed', 'Mislukt'),
+    )
+
 class UBXFile(models.Model):
     """ u-blox GNSS raw datafile """
     device = models.ForeignKey(Device)
@@ -578,35 +896,75 @@ class UBXFile(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     start = models.DateTimeField(null=True,verbose_name = 'begin')
     stop = models.DateTimeField(null=True,verbose_name = 'einde')
+    offset = models.BigIntegerField(default=0,verbose_name='verwerkt',help_text='Aantal bytes dat is gescand voor begin en einde')
+
+    # status of rtk postprocessing
+    status = models.CharField(max_length=10,blank=True,choices=POST_STATUS,verbose_name='postprocessing')
+    queued = models.DateTimeField(null=True,blank=True,verbose_name='in wachtrij')
+    started = models.DateTimeField(null=True,blank=True,verbose_name='gestart')
+    finished = models.DateTimeField(null=True,blank=True,verbose_name='voltooid')
+    error = models.TextField(blank=True,verbose_name='foutmelding')
         
-    def create_pvts(self):
-        """ parse file and extract UBX-NAV-PVT messages """
-        from peil.util import iterpvt
-    
-        count = 0
-        for fields in iterpvt(self.ubxfile):
-            timestamp = fields.pop('timestamp')
-            self.navpvt_set.update_or_create(timestamp=timestamp,defaults=fields)
-            count += 1
-        return count
+    def create_pvts(self, decimate=1):
+        """
+        @summary: parse file and add UBX-NAV-PVT messages that are not stored yet in one transaction
+        @param decimate: keep only epochs where the number of seconds since 1970 is a multiple of decimate
+        @return: number of messages added
+        """
+        from peil import ublox
+        pvt, _end = ublox.navpvt(ublox.read(self.ubxfile))
+        df = ublox.fixes(pvt).drop_duplicates('timestamp', keep='last')
+        if decimate > 1:
+            seconds = df.timestamp.values.astype('datetime64[s]').astype(np.int64)
+            df = df[seconds % decimate == 0]
+        with transaction.atomic():
+            existing = set(self.navpvt_set.values_list('timestamp', flat=True))
+            pvts = []
+            for row in df.itertuples(index=False):
+                timestamp = row.timestamp.to_pydatetime()
+                if timestamp not in existing:
+                    pvts.append(NavPVT(ubx=self, timestamp=timestamp, lat=row.lat, lon=row.lon, 
+                                       alt=int(row.alt), msl=int(row.msl), hAcc=int(row.hAcc), vAcc=int(row.vAcc), 
+                                       numSV=int(row.numSV), pDOP=row.pDOP))
+            NavPVT.objects.bulk_create(pvts, batch_size=1000)
+        return len(pvts)
     
     def post(self):
         """ run rtk post """
         from peil import rtk
-        import pytz
         
-        count=0
         sol = rtk.post(self)
-        if sol:
-            with transaction.atomic():
-                self.rtksolution_set.all().delete()
-                for fields in rtk.itersol(sol):
-                    time = fields.pop('time')
-                    time = pytz.utc.localize(time) 
-                    self.rtksolution_set.create(time=time, **fields)
-                    count += 1
-        return count
+        if not sol:
+            return 0
+        return self.load_solutions(sol)
+
+    def load_solutions(self, sol):
+        """ replace rtk solutions with the contents of solution file sol. Returns number of solutions """
+        from peil import rtk
+
+        df = rtk.readsol(sol).drop_duplicates('time', keep='last')
+        solutions = [RTKSolution(ubx=self, time=row.time.to_pydatetime(), lon=row.lon, lat=row.lat, alt=row.alt,
+                                 q=int(row.q), ns=int(row.ns), sde=row.sde, sdn=row.sdn, sdu=row.sdu, 
+                                 x=row.x, y=row.y, z=row.z) for row in df.itertuples(index=False)]
+        with transaction.atomic():
+            self.rtksolution_set.all().delete()
+            RTKSolution.objects.bulk_create(solutions, batch_size=1000)
+        return len(solutions)
         
+    def queue_post(self):
+        """ add to queue of manage.py rtk_worker for postprocessing """
+        self.status = 'queued'
+        self.queued = timezone.now()
+        self.started = self.finished = None
+        self.error = ''
+        self.save(update_fields=['status','queued','started','finished','error'])
+
+    def post_duration(self):
+        if self.started and self.finished:
+            return self.finished - self.started
+        return None
+    post_duration.short_description='duur'
+
     def solution_count(self):
         return self.rtksolution_set.count()
     solution_count.short_description='rtk fixes'
@@ -632,9 +990,18 @@ class UBXFile(models.Model):
 
 @receiver(pre_save, sender=UBXFile)
 def ubxfile_save(sender, instance, **kwargs):
-    """ find out time of first and last message when saving to database """
-    from peil.util import ubxtime
-    instance.start, instance.stop = ubxtime(instance.ubxfile)
+    """ find out time of first and last message when saving to database. Only data appended since the previous save is scanned """
+    from peil.util import ubxscan
+    ubxfile = instance.ubxfile
+    if not ubxfile._committed or instance.offset > ubxfile.size:
+        # new upload or file has been replaced
+        instance.start = instance.stop = None
+        instance.offset = 0
+    start, stop, instance.offset = ubxscan(ubxfile, instance.offset)
+    if instance.start is None:
+        instance.start = start
+    if stop is not None:
+        instance.stop = stop
 
 QUALITY_CHOICES = (
     (0, 'None'),
@@ -0,0 +1,196 @@
+'''
+Created on Oct 18, 2026
+
+Outbox for updates to the Orion Context Broker.
+Updates are stored in the database while ingesting messages and published in batches by manage.py orion_publisher
+'''
+from collections import OrderedDict
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from datetime import timedelta
+import requests
+import json
+import logging
+
+from peil.models import OrionUpdate, LocationMessage
+from peil.fiware import NGSI
+from peil.util import last_waterlevel
+
+logger = logging.getLogger(__name__)
+
+# NGSI type of attributes in the popup view entities
+VIEW_TYPES = {'inclination': 'Integer', 'batteryLevel': 'Integer'}
+
+def entity_updates(messages):
+    """
+    @summary: collect the attributes to update per entity for a batch of stored messages
+    @param messages: list of LoraMessage instances
+    @return: OrderedDict of (entity id, entity type) to dict of NGSI v2 attributes
+    """
+    updates = OrderedDict()
+    levels = OrderedDict()
+    for msg in sorted(messages, key=lambda m: m.time):
+        if isinstance(msg, LocationMessage):
+            # locations are published by create_device
+            continue
+        device = msg.sensor.device
+        attribute = NGSI.attribute(msg)
+        value = msg.value()
+        timestamp = NGSI.timestamp(msg)
+        entity = updates.setdefault((device.devid, 'Peilstok'), {})
+        entity[attribute] = {'type': 'LoraMessage', 'value': {'value': value, 'timestamp': timestamp}}
+        entity['lastSeen'] = timestamp
+        view = updates.setdefault(('view_'+device.devid, 'PeilstokView'), {})
+        view[attribute] = {'type': VIEW_TYPES.get(attribute, 'Float'), 'value': value}
+        view['lastSeen'] = timestamp
+        if attribute in ['airPressure','waterPressure']:
+            levels[device.pk] = device
+
+    for device in levels.values():
+        level = last_waterlevel(device)
+        if 'nap' in level and level['time']:
+            updates[(device.devid, 'Peilstok')]['waterLevel'] = {'type': 'LoraMessage', 'value': {'value': level['nap'], 'timestamp': NGSI.timestamp(level['time'])}}
+            updates[('view_'+device.devid, 'PeilstokView')]['waterLevel'] = {'type': 'Float', 'value': level['nap']}
+    return updates
+
+def enqueue(messages):
+    """ store updates of Orion entities for a batch of messages in the outbox. Call this in the transaction that stores the messages """
+    rows = [OrionUpdate(entity_id=entity_id, entity_type=entity_type, attributes=json.dumps(attrs))
+            for (entity_id, entity_type), attrs in entity_updates(messages).items()]
+    OrionUpdate.objects.bulk_create(rows)
+    return len(rows)
+
+def coalesce(rows):
+    """
+    @summary: merge pending updates of the same entity. Later updates replace earlier values of the same attribute
+    @param rows: list of OrionUpdate instances, ordered by id
+    @return: OrderedDict of (entity id, entity type) to tuple of (list of row ids, dict of attributes)
+    """
+    entities = OrderedDict()
+    for row in rows:
+        ids, attrs = entities.setdefault((row.entity_id, row.entity_type), ([], {}))
+        ids.append(row.pk)
+        attrs.update(row.attrs())
+    return entities
+
+class PublishError(Exception):
+    pass
+
+class Publisher:
+    ''' Publishes the outbox to Orion with NGSI v2 batch updates '''
+
+    def __init__(self, orion, batch_size=500, max_attempts=10, lease=600, backoff=30):
+        """
+        @param orion: fiware.Orion instance
+        @param batch_size: maximum number of pending updates per batch request
+        @param max_attempts: updates that failed this many times are not published anymore
+        @param lease: seconds after which updates claimed by a publisher that stopped are published again
+        @param backoff: seconds to wait before the first retry of a failed update, doubled after every failure
+        """
+        self.orion = orion
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.backoff = backoff
+
+    def send(self, entities):
+        """ send entities with op/update requests. Returns None when successful, otherwise the error message and the status code """
+        try:
+            responses = self.orion.update_entities([dict(attrs, id=entity_id, type=entity_type) for (entity_id, entity_type), (_ids, attrs) in entities.items()])
+        except requests.RequestException as e:
+            return str(e), None
+        for response in responses:
+            if not response.ok:
+                return '{} {}'.format(response.status_code, response.text), response.status_code
+        return None
+
+    def in_order(self, rows):
+        """
+        @summary: drop updates of entities that have older updates waiting for a retry or being sent by another publisher,
+            so a retry never overwrites newer values in Orion
+        @param rows: list of OrionUpdate instances, ordered by id
+        @return: list of the updates that can be published now
+        """
+        if not rows:
+            return rows
+        ids = [row.pk for row in rows]
+        older = (OrionUpdate.objects.filter(entity_id__in=set(row.entity_id for row in rows), attempts__lt=self.max_attempts, id__lt=ids[-1])
+                 .exclude(pk__in=ids).values_list('entity_id','entity_type','id'))
+        # first pending update per entity that is not in this batch
+        blocked = {}
+        for entity_id, entity_type, pk in older:
+            key = (entity_id, entity_type)
+            blocked[key] = min(pk, blocked.get(key, pk))
+        return [row for row in rows if (row.entity_id, row.entity_type) not in blocked or row.pk < blocked[(row.entity_id, row.entity_type)]]
+
+    def claim(self):
+        """ mark the oldest pending updates as being sent and return them. Counts as an attempt, so updates that crash a publisher are eventually given up """
+        now = timezone.now()
+        expired = now - timedelta(seconds=self.lease)
+        with transaction.atomic():
+            # entities with updates waiting for a retry or being sent by another publisher
+            waiting = (OrionUpdate.objects.filter(attempts__lt=self.max_attempts)
+                       .filter(Q(next_attempt__gt=now) | Q(claimed__gte=expired))
+                       .values_list('entity_id', flat=True).distinct())
+            # skip rows that are locked by other publishers
+            rows = list(OrionUpdate.objects.select_for_update(skip_locked=True)
+                        .filter(attempts__lt=self.max_attempts, next_attempt__lte=now)
+                        .filter(Q(claimed__isnull=True) | Q(claimed__lt=expired))
+                        .exclude(entity_id__in=list(waiting))
+                        .order_by('id')[:self.batch_size])
+            # drop entities with older rows that other publishers locked but have not claimed yet
+            rows = self.in_order(rows)
+            OrionUpdate.objects.filter(pk__in=[row.pk for row in rows]).update(claimed=now, attempts=F('attempts')+1)
+        for row in rows:
+            row.attempts += 1
+        return rows
+
+    def failed(self, rows, error):
+        """ release failed updates for a retry after a delay that doubles after every attempt """
+        logger.error('Orion update failed: {}'.format(error))
+        now = timezone.now()
+        for row in rows:
+            row.next_attempt = now + timedelta(seconds=self.backoff * 2 ** (row.attempts - 1))
+            OrionUpdate.objects.filter(pk=row.pk).update(claimed=None, next_attempt=row.next_attempt, error=error[:1000])
+
+    def publish(self):
+        """
+        @summary: publish the oldest pending updates in one batch request.
+            The updates are claimed and the results recorded in short transactions, no rows are locked while sending
+        @return: number of published updates
+        @raise PublishError: when Orion could not be reached or rejected the batch
+        """
+        rows = self.claim()
+        if not rows:
+            return 0
+        failed = []
+        entities = coalesce(rows)
+        error = self.send(entities)
+        if error and error[1] and 400 <= error[1] < 500 and len(entities) > 1:
+            # rejected by Orion: send entities one by one, so only the offending entities are retried
+            for key, value in entities.items():
+                entity_error = self.send(OrderedDict([(key, value)]))
+                if entity_error:
+                    failed.append((value[0], entity_error[0]))
+        elif error:
+            failed.append(([row.pk for row in rows], error[0]))
+
+        failed_ids = set(pk for ids, _error in failed for pk in ids)
+        with transaction.atomic():
+            OrionUpdate.objects.filter(pk__in=[row.pk for row in rows if row.pk not in failed_ids]).delete()
+            for ids, message in failed:
+                self.failed([row for row in rows if row.pk in ids], message)
+
+        if failed and len(failed_ids) == len(rows):
+            raise PublishError(failed[0][1])
+        return len(rows) - len(failed_ids)
+
+    def drain(self):
+        """ publish until the outbox is empty. Returns number of published updates """
+        total = 0
+        while True:
+            count = self.publish()
+            if not count:
+                return total
+            total += count
@@ -0,0 +1,137 @@
+'''
+Created on Oct 18, 2026
+
+Scheduler for rtk postprocessing. The admin actions queue ubx files, manage.py rtk_worker processes them in parallel
+'''
+from django.db import transaction, connection
+from django.utils import timezone
+from multiprocessing import Pool, cpu_count
+from datetime import timedelta
+import time
+import logging
+
+from peil.models import UBXFile
+from peil import rtk
+
+logger = logging.getLogger(__name__)
+
+def queue(ubxfiles):
+    ''' queue ubx files for postprocessing. Returns number of queued files '''
+    count = 0
+    for ubx in ubxfiles:
+        ubx.queue_post()
+        count += 1
+    return count
+
+def run(path, start):
+    ''' runs in a worker process. Returns (path of solution file, error message) '''
+    try:
+        return rtk.run(path, start), None
+    except Exception as e:
+        return None, str(e) or e.__class__.__name__
+
+class Scheduler:
+    ''' runs queued postprocessing jobs in a pool of processes '''
+
+    def __init__(self, processes=None, timeout=3600):
+        """
+        @param processes: number of parallel jobs, defaults to the number of CPUs
+        @param timeout: seconds after which a job without result is marked as failed, for instance when its process died
+        """
+        self.processes = processes or cpu_count()
+        self.timeout = timeout
+        self.pool = None
+        self.jobs = {}
+
+    def claim(self, count):
+        """ mark at most count queued ubx files as running and return them """
+        with transaction.atomic():
+            # skip files that are claimed by other workers
+            ubxfiles = list(UBXFile.objects.select_for_update(skip_locked=True)
+                            .filter(status='queued').order_by('queued')[:count])
+            now = timezone.now()
+            UBXFile.objects.filter(pk__in=[u.pk for u in ubxfiles]).update(status='running', started=now)
+        for ubx in ubxfiles:
+            ubx.status, ubx.started = 'running', now
+        return ubxfiles
+
+    def submit(self):
+        """ start queued jobs when there are idle processes. Returns number of started jobs """
+        free = self.processes - len(self.jobs)
+        if free <= 0:
+            return 0
+        ubxfiles = self.claim(free)
+        if ubxfiles and self.pool is None:
+            # forked processes must not share the database connection
+            connection.close()
+            self.pool = Pool(self.processes)
+        for ubx in ubxfiles:
+            logger.debug('Postprocessing started for {}'.format(ubx))
+            self.jobs[ubx.pk] = (ubx, self.pool.apply_async(run, (ubx.ubxfile.path, ubx.start)))
+        return len(ubxfiles)
+
+    def finish(self, ubx, pos, error):
+        """ store the results of a job """
+        if pos:
+            try:
+                count = ubx.load_solutions(pos)
+                logger.debug('Postprocessing completed for {}: {} solutions'.format(ubx, count))
+            except Exception as e:
+                error = str(e)
+        ubx.status = 'failed' if error else 'done'
+        ubx.error = error or ''
+        ubx.finished = timezone.now()
+        UBXFile.objects.filter(pk=ubx.pk).update(status=ubx.status, error=ubx.error, finished=ubx.finished)
+        if error:
+            logger.error('Postprocessing failed for {}: {}'.format(ubx, error))
+
+    def collect(self):
+        """ store the results of completed jobs. Returns number of completed jobs """
+        done = [pk for pk, (_ubx, result) in self.jobs.items() if result.ready()]
+        for pk in done:
+            ubx, result = self.jobs.pop(pk)
+            try:
+                pos, error = result.get()
+            except Exception as e:
+                pos, error = None, str(e)
+            self.finish(ubx, pos, error)
+        return len(done)
+
+    def expire(self):
+        """ mark jobs that did not complete within the timeout as failed. Returns number of expired jobs.
+        The pool is restarted to stop hanging processes, other running jobs are queued again """
+        limit = timezone.now() - timedelta(seconds=self.timeout)
+        expired = [pk for pk, (ubx, _result) in self.jobs.items() if ubx.started < limit]
+        if not expired:
+            return 0
+        self.pool.terminate()
+        self.pool = None
+        for pk in expired:
+            ubx, _result = self.jobs.pop(pk)
+            self.finish(ubx, None, 'No result after {} seconds'.format(self.timeout))
+        UBXFile.objects.filter(pk__in=self.jobs.keys()).update(status='queued', started=None)
+        self.jobs = {}
+        return len(expired)
+
+    def requeue(self):
+        """ queue files again that were left running by a worker that stopped """
+        return UBXFile.objects.filter(status='running').update(status='queued', started=None)
+
+    def run(self, once=False, interval=5.0):
+        """
+        @summary: process queued files
+        @param once: return when the queue is empty and all jobs have completed
+        @param interval: seconds between checks for new and completed jobs
+        """
+        try:
+            while True:
+                self.collect()
+                self.expire()
+                self.submit()
+                if once and not self.jobs:
+                    break
+                time.sleep(interval)
+        finally:
+            if self.pool:
+                self.pool.terminate()
+                self.pool = None
@@ -0,0 +1,159 @@
+'''
+Created on Oct 18, 2026
+
+Hourly and daily statistics per sensor, maintained incrementally
+'''
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDay
+from django.utils.timezone import utc
+import pandas as pd
+import json
+import logging
+from datetime import timedelta
+
+from peil.models import Sensor, Rollup
+
+logger = logging.getLogger(__name__)
+
+# raw ADC values equal to or above this limit are ignored in raw statistics (like get_raw_sensor_data)
+RAW_LIMIT = 4096
+
+def adc_fields(columns):
+    ''' names of the raw fields with ADC counts '''
+    return [name for name in columns if name.startswith('adc')]
+
+# pandas frequency per rollup interval
+FREQUENCIES = {'H': 'H', 'D': 'D'}
+
+def nan2none(value):
+    return None if pd.isnull(value) else float(value)
+
+def compute(sensor, df, interval):
+    """
+    @summary: calculate statistics per interval
+    @param sensor: the sensor
+    @param df: dataframe with raw values indexed on time, as returned by Sensor.frame()
+    @param interval: 'H' or 'D'
+    @return: list of unsaved Rollup instances
+    """
+    if df.empty:
+        return []
+    values = pd.Series(sensor.calibrate_frame(df), index=df.index, dtype=float)
+    key = df.index.floor(FREQUENCIES[interval])
+    counts = values.groupby(key).size()
+    stats = values.groupby(key).agg(['mean','min','max'])
+    raw = df.astype(float)
+    adc = adc_fields(raw.columns)
+    if adc:
+        raw[adc] = raw[adc].where(raw[adc] < RAW_LIMIT)
+    raw = raw.groupby(key).agg(['mean','min','max'])
+
+    result = []
+    for time, count in counts.iteritems():
+        rawstats = {field: {stat: nan2none(raw.loc[time,(field,stat)]) for stat in ('mean','min','max')} for field in df.columns}
+        result.append(Rollup(sensor_id=sensor.pk, interval=interval, time=time.to_pydatetime(), count=int(count),
+                             mean=nan2none(stats.at[time,'mean']), min=nan2none(stats.at[time,'min']), max=nan2none(stats.at[time,'max']),
+                             raw=json.dumps(rawstats)))
+    return result
+
+def floor_day(time):
+    return pd.Timestamp(time).tz_convert('UTC').floor('D').to_pydatetime()
+
+def floor_hour(time):
+    return pd.Timestamp(time).tz_convert('UTC').floor('H').to_pydatetime()
+
+def update(sensor, start, stop, hours=None):
+    """
+    @summary: recalculate rollups of a sensor for all days between start and stop (inclusive)
+    @param hours: optional set of hours to recalculate. Default is all hours of these days
+    @return: number of rollups written
+    """
+    first = floor_day(start)
+    last = floor_day(stop) + timedelta(days=1)
+    df = sensor.frame(first, last)
+    hourly = compute(sensor, df, 'H')
+    daily = compute(sensor, df, 'D')
+    with transaction.atomic():
+        query = Rollup.objects.filter(sensor_id=sensor.pk)
+        if hours is None:
+            query.filter(interval='H', time__gte=first, time__lt=last).delete()
+        else:
+            hourly = [r for r in hourly if r.time in hours]
+            query.filter(interval='H', time__in=hours).delete()
+        query.filter(interval='D', time__gte=first, time__lt=last).delete()
+        Rollup.objects.bulk_create(hourly + daily)
+    return len(hourly) + len(daily)
+
+def extend_coverage(sensor, first, last):
+    """
+    @summary: lower the start of the complete rollups of a sensor after all days from first to last have been updated
+    @param first: start of first updated day
+    @param last: start of last updated day
+    """
+    nextday = last + timedelta(days=1)
+    since = Sensor.objects.filter(pk=sensor.pk).values_list('rollups_since',flat=True).first()
+    if since is None:
+        # complete when there are no messages after the updated days
+        if sensor.loramessage_set.filter(time__gte=nextday).exists():
+            return
+    elif since > nextday or since <= first:
+        # not adjacent to the covered period, or nothing to extend
+        return
+    Sensor.objects.filter(pk=sensor.pk).update(rollups_since=first)
+    sensor.rollups_since = first
+
+def update_messages(messages):
+    """
+    @summary: recalculate rollups for the hours and days of a batch of stored messages.
+        Only the hours of the messages are recalculated, unless the messages are older than the complete rollups of the sensor.
+        Then all hours of their days are recalculated, so the complete period can be extended over these days
+    """
+    times = {}
+    for msg in messages:
+        times.setdefault(msg.sensor, []).append(msg.time)
+    for sensor, stamps in times.items():
+        first, last = floor_day(min(stamps)), floor_day(max(stamps))
+        try:
+            since = Sensor.objects.filter(pk=sensor.pk).values_list('rollups_since',flat=True).first()
+            if since is None or first < since:
+                update(sensor, first, last)
+                extend_coverage(sensor, first, last)
+            else:
+                update(sensor, first, last, hours=set(floor_hour(t) for t in stamps))
+        except Exception as e:
+            # concurrent updates of the same day. manage.py rollup --repair recalculates these days
+            logger.error('Error updating rollups of sensor {}: {}'.format(sensor.pk, e))
+
+def incomplete_days(sensor, start=None):
+    """
+    @summary: find days where the number of messages in the daily rollup differs from the number of stored messages,
+        for instance after concurrent updates at ingest failed
+    @param start: optional start time
+    @return: sorted list of start times of days to recalculate
+    """
+    messages = sensor.loramessage_set.all()
+    rollups = Rollup.objects.filter(sensor=sensor, interval='D')
+    if start:
+        messages = messages.filter(time__gte=floor_day(start))
+        rollups = rollups.filter(time__gte=floor_day(start))
+    counts = dict(messages.annotate(day=TruncDay('time', tzinfo=utc)).order_by().values_list('day').annotate(count=Count('id')))
+    stored = dict(rollups.values_list('time','count'))
+    return sorted(day for day in set(counts) | set(stored) if counts.get(day, 0) != stored.get(day, 0))
+
+def watermark(sensor):
+    """ returns start of the last day with rollups for a sensor, or None """
+    return Rollup.objects.filter(sensor=sensor, interval='D').order_by('time').values_list('time',flat=True).last()
+
+def series(sensor, interval='H', start=None, stop=None, stat='mean'):
+    """ returns Pandas series with a calibrated statistic from the rollups of a sensor """
+    query = Rollup.objects.filter(sensor=sensor, interval=interval)
+    if start:
+        query = query.filter(time__gte=start)
+    if stop:
+        query = query.filter(time__lt=stop)
+    rows = list(query.order_by('time').values_list('time',stat))
+    if not rows:
+        return pd.Series([], index=pd.DatetimeIndex([], tz='UTC'), dtype=float)
+    t, x = zip(*rows)
+    return pd.Series(x, index=pd.to_datetime(t, utc=True), dtype=float)
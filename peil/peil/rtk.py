@@ -6,94 +6,117 @@ Created on Sep 2, 2017
 import os
 import logging
 import shutil
-from csv import DictReader
+import tempfile
+import pandas as pd
 from peil.util import get_broadcast_files, get_ephemeres_files, rdnap
-import datetime
+from peil.corrections import link
 
 logger = logging.getLogger(__name__)
 
-def itersol(pos):
-    """ iterate over rtk solution file """ 
+# columns of rnx2rtkp solution file and names of RTKSolution fields
+POS_COLUMNS = {
+    'latitude(deg)': 'lat',
+    'longitude(deg)': 'lon',
+    'height(m)': 'alt',
+    'Q': 'q',
+    'ns': 'ns',
+    'sdn(m)': 'sdn',
+    'sde(m)': 'sde',
+    'sdu(m)': 'sdu'
+    }
+
+def readsol(pos):
+    """
+    @summary: read rtk solution file
+    @return: Pandas dataframe with columns time (UTC), lat, lon, alt, q, ns, sdn, sde, sdu and RD/NAP coordinates x, y, z
+    """ 
+    columns = ['time','lat','lon','alt','q','ns','sdn','sde','sdu','x','y','z']
     with open(pos) as fpos:
         names = None
-        for line in fpos:
+        # use readline: mixing iteration and read() on a file is not allowed in Python 2
+        line = fpos.readline()
+        while line:
             if line.startswith('%  GPST'):
-                line = line[2:]
-                names = [h.strip() for h in line.split(',')]
+                names = [h.strip() for h in line[2:].split(',')]
                 break
+            line = fpos.readline()
         if not names:
-            yield {}
-        reader = DictReader(fpos,fieldnames=names)
-        for row in reader:
-            gpst = row['GPST']
-            lat = float(row['latitude(deg)'])
-            lon = float(row['longitude(deg)'])
-            alt = float(row['height(m)'])
-            x,y,z = rdnap.to_rdnap(lon,lat,alt)
-            yield {
-                'time': datetime.datetime.strptime(gpst[:-4],'%Y/%m/%d %H:%M:%S'),
-                'lat': lat,
-                'lon': lon,
-                'alt': alt,
-                'q': int(row['Q']),
-                'ns': int(row['ns']),
-                'sdn': float(row['sdn(m)']),
-                'sde': float(row['sde(m)']),
-                'sdu': float(row['sdu(m)']),
-                'x': x,
-                'y': y,
-                'z': z
-            }
+            return pd.DataFrame(columns=columns)
+        df = pd.read_csv(fpos, header=None, names=names, skipinitialspace=True, comment='%')
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    df = df.rename(columns=POS_COLUMNS)
+    # skip fraction of seconds
+    df['time'] = pd.to_datetime(df['GPST'].str[:19], format='%Y/%m/%d %H:%M:%S').dt.tz_localize('UTC')
+    xyz = rdnap.to_rdnap_many(df['lon'].values, df['lat'].values, df['alt'].values)
+    df['x'], df['y'], df['z'] = xyz[:,0], xyz[:,1], xyz[:,2]
+    return df[columns]
 
-            
-def post(ubx, **kwargs):
-    """ post processing with RTKLIB """
-    import subprocess32 as subprocess
-    
-    path = unicode(ubx.ubxfile.file)
-    ubxdir = os.path.dirname(path)
-    ubxfile = os.path.basename(path)
-    
-    os.chdir(ubxdir)
+def itersol(pos):
+    """ iterate over rtk solution file """ 
+    df = readsol(pos)
+    for row in df.itertuples(index=False):
+        fields = row._asdict()
+        fields['time'] = row.time.to_pydatetime()
+        yield fields
 
-    logger.debug('Postprocessing started for {}, file={}'.format(unicode(ubx.device), ubxfile))
+class PostError(Exception):
+    pass
 
-    # convert ubx file to rinex
-    command = ['convbin', ubxfile]
-    logger.debug('Running {}'.format(' '.join(command)))
-    ret = subprocess.call(command)
-    if ret:
-        logger.error('convbin failed. Exit code = %d' % ret)
-        return None
+def run(path, start):
+    """
+    @summary: post processing of a ubx file with RTKLIB in a private working directory, safe to run in parallel
+    @param path: full path of the ubx file
+    @param start: time of first observation, used to select the correction files
+    @return: path of the solution file, stored next to the ubx file
+    @raise PostError: when convbin or rnx2rtkp fails
+    """
+    import subprocess32 as subprocess
     
-    name, ext = os.path.splitext(ubxfile)
+    ubxdir, ubxfile = os.path.split(path)
+    name, _ext = os.path.splitext(ubxfile)
     obs = name+'.obs'
     nav = name+'.nav'
     sbs = name+'.sbs'
     pos = name+'.pos'
     
-    start = kwargs.get('start',ubx.start)
-    # create temp dir for correction files
-    tempdir = name+'.d'
-    if not os.path.exists(tempdir):
-        os.mkdir(tempdir)
+    # working dir on the same file system as the media folder, so correction files can be hard linked
+    workdir = tempfile.mkdtemp(prefix='.'+name+'.', dir=ubxdir)
     try:
-        # copy broadcast, ephemeris and clock files to temp dir
-        # TODO: could use os.symlink() here?
-        for fname in get_broadcast_files(start):
-            shutil.copy(fname, tempdir)
-        for fname in get_ephemeres_files(start):
-            shutil.copy(fname, tempdir)
+        # convert ubx file to rinex
+        command = ['convbin', '-d', workdir, path]
+        logger.debug('Running {}'.format(' '.join(command)))
+        ret = subprocess.call(command, cwd=workdir)
+        if ret:
+            raise PostError('convbin failed. Exit code = %d' % ret)
+
+        # link broadcast, ephemeris and clock files from the cache to working dir
+        corrdir = os.path.join(workdir, 'corr')
+        os.mkdir(corrdir)
+        link(get_broadcast_files(start) + get_ephemeres_files(start), corrdir)
             
-        command = ['rnx2rtkp', '-k', 'rtkpost.conf', '-t', '-s', ',', '-p', '7', '-c', '-o', pos, obs, nav, sbs, tempdir+'/*']
+        conf = os.path.join(ubxdir, 'rtkpost.conf')
+        command = ['rnx2rtkp', '-k', conf, '-t', '-s', ',', '-p', '7', '-c', '-o', pos, obs, nav, sbs, 'corr/*']
         logger.debug('Running {}'.format(' '.join(command)))
-        ret = subprocess.call(command)
+        ret = subprocess.call(command, cwd=workdir)
         if ret:
-            logger.error('rnx2rtkp failed. Exit code = %d' % ret)
-        else:
-            logger.debug('Postprocessing completed')
-            return pos
+            raise PostError('rnx2rtkp failed. Exit code = %d' % ret)
+        if not os.path.exists(os.path.join(workdir, pos)):
+            raise PostError('rnx2rtkp did not create {}'.format(pos))
+        dest = os.path.join(ubxdir, pos)
+        shutil.move(os.path.join(workdir, pos), dest)
+        return dest
     finally:
-        # remove temp dir with correction files
-        shutil.rmtree(tempdir, ignore_errors=True)    
-    return None
+        # remove working dir with rinex and correction files
+        shutil.rmtree(workdir, ignore_errors=True)    
+
+def post(ubx, **kwargs):
+    """ post processing with RTKLIB. Returns path of the solution file or None when processing failed """
+    logger.debug('Postprocessing started for {}, file={}'.format(unicode(ubx.device), ubx.ubxfile.name))
+    try:
+        pos = run(ubx.ubxfile.path, kwargs.get('start',ubx.start))
+        logger.debug('Postprocessing completed')
+        return pos
+    except PostError as e:
+        logger.error(e)
+        return None
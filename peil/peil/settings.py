@@ -138,10 +138,50 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 GNSS_URL = '/gnss/'
 GNSS_ROOT = os.path.join(BASE_DIR, 'media','gnss')
+# seconds to wait before trying again to download a correction file that was not available
+GNSS_RETRY = 3600
+# seconds to keep a correction file that has been superseded by a better product, running jobs may still use it
+GNSS_DISCARD_AFTER = 3600
+
+# caches. The shared cache is used by all processes (web, ingest_worker) for the device and sensor lookups during ingest.
+# When redis is not available, cache operations fail silently and lookups go to the database
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+        'OPTIONS': {'IGNORE_EXCEPTIONS': True},
+    },
+}
+# name of the cache in CACHES for device and sensor lookups during ingest. 
+# Without a shared cache lookups are kept in process memory, which is only safe when a single process stores messages
+INGEST_CACHE = 'shared'
+INGEST_CACHE_TIMEOUT = 300 # seconds
+
+# name of the cache in CACHES for the current locations of the devices on the map. Must be shared by all processes,
+# with a cache per process (like 'default') new locations show up after LOCATIONS_CACHE_TIMEOUT
+LOCATIONS_CACHE = 'shared'
+LOCATIONS_CACHE_TIMEOUT = 3600 # seconds
+
+# maintain hourly and daily rollups while storing messages (otherwise run manage.py rollup periodically)
+ROLLUP_AT_INGEST = True
+# read chart series from rollups for the period where they are complete (Sensor.rollups_since), older data is aggregated from the messages
+USE_ROLLUPS = True
+
+# keep original uplinks from TTN and KPN for reprocessing (manage.py reprocess)
+ARCHIVE_UPLINKS = True
+# only validate and queue uplinks in the webhooks, messages are stored by manage.py ingest_worker.
+# Enable only when ingest_worker is running, otherwise no messages are stored
+INGEST_QUEUE = False
 
 # send updates to Orion Context broker?
 USE_ORION = True
 ORION_URL = 'http://fiware.acaciadata.com:1026/v2/'
+# store updates for Orion in an outbox that is published by manage.py orion_publisher, instead of updating Orion while ingesting.
+# Enable only when orion_publisher is running, otherwise nothing is sent to Orion
+ORION_OUTBOX = False
+# hashes of the entity attributes sent by manage.py orion_sync
+ORION_SYNC_STATE = os.path.join(BASE_DIR, 'orion_sync.json')
 
 # Logging
 LOGGING_ROOT = os.path.join(BASE_DIR, 'logs')
@@ -0,0 +1,149 @@
+'''
+Created on Oct 18, 2026
+
+Parser for u-blox UBX binary files.
+Frames are located with numpy on a memory mapped file, checksums are verified and corrupt bytes are skipped
+'''
+import mmap
+import numpy as np
+import pandas as pd
+
+UBX_SYNC = (0xB5, 0x62)
+UBX_RXM_RAW = 0x1002
+UBX_RXM_SFRB = 0x1102
+UBX_NAV_POSLLH = 0x0102
+UBX_NAV_PVT = 0x0701
+
+# first 84 bytes of the payload of UBX-NAV-PVT (newer firmware sends 92 bytes with the same first 84 bytes)
+PVT_DTYPE = np.dtype([
+    ('iTOW','<u4'), ('year','<u2'), ('month','u1'), ('day','u1'), ('hour','u1'), ('min','u1'), ('sec','u1'),
+    ('valid','i1'), ('tAcc','<u4'), ('nano','<i4'), ('fixType','u1'), ('flags','i1'), ('reserved1','u1'), ('numSV','u1'),
+    ('lon','<i4'), ('lat','<i4'), ('height','<i4'), ('hMSL','<i4'), ('hAcc','<u4'), ('vAcc','<u4'),
+    ('velN','<i4'), ('velE','<i4'), ('velD','<i4'), ('gSpeed','<i4'), ('heading','<i4'), ('sAcc','<u4'), ('headingAcc','<u4'),
+    ('pDOP','<u2'), ('reserved2','<u2'), ('reserved3','<u4')])
+
+def read(ubx):
+    """
+    @summary: returns contents of a ubx file as numpy array of bytes without copying when possible
+    @param ubx: filename, file object or Django FieldFile
+    """
+    if isinstance(ubx, basestring):
+        path = ubx
+    elif getattr(ubx, '_committed', False):
+        # FieldFile stored on disk
+        path = ubx.path
+    else:
+        path = None
+    if path:
+        with open(path, 'rb') as f:
+            try:
+                return np.frombuffer(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), dtype=np.uint8)
+            except ValueError:
+                # empty file can not be mapped
+                return np.zeros(0, dtype=np.uint8)
+    if hasattr(ubx, 'open') and ubx.closed:
+        ubx.open('rb')
+    ubx.seek(0)
+    return np.frombuffer(ubx.read(), dtype=np.uint8)
+
+def checksum(data):
+    ''' returns 8-bit Fletcher checksum (ck_a, ck_b) of an array of bytes '''
+    n = len(data)
+    values = data.astype(np.int64)
+    return int(values.sum() & 0xFF), int(np.dot(values, np.arange(n, 0, -1)) & 0xFF)
+
+def scan(data, start=0):
+    """
+    @summary: find valid UBX frames. Frames with invalid checksums and bytes between frames are skipped
+    @param data: numpy array of bytes
+    @param start: offset to start scanning
+    @return: list of (message id, payload offset, payload length) and offset where scanning can resume when data is appended.
+        This is the start of a truncated frame at the end of the data or the end of the last valid frame
+    """
+    n = len(data)
+    frames = []
+    end = start
+    truncated = None
+    if n - start < 2:
+        return frames, end
+    tail = data[start:]
+    candidates = np.flatnonzero((tail[:-1] == UBX_SYNC[0]) & (tail[1:] == UBX_SYNC[1])) + start
+    pos = start
+    for c in candidates.tolist():
+        if c < pos:
+            # inside previous frame
+            continue
+        if c + 6 > n:
+            truncated = truncated or c
+            break
+        length = int(data[c+4]) | int(data[c+5]) << 8
+        stop = c + 6 + length + 2
+        if stop > n:
+            # incomplete frame or corrupt length
+            if truncated is None:
+                truncated = c
+            continue
+        if checksum(data[c+2:c+6+length]) != (int(data[stop-2]), int(data[stop-1])):
+            # corrupt frame: resync on next sync bytes
+            continue
+        msgid = int(data[c+2]) | int(data[c+3]) << 8
+        frames.append((msgid, c + 6, length))
+        pos = end = stop
+        truncated = None
+    if truncated is not None:
+        end = truncated
+    return frames, end
+
+def iterframes(ubx):
+    """ generates (message id, payload) of valid frames in a ubx file. Payloads are numpy arrays of bytes """
+    data = read(ubx)
+    frames, _end = scan(data)
+    for msgid, offset, length in frames:
+        yield msgid, data[offset:offset+length]
+
+def navpvt(data, start=0):
+    """
+    @summary: decode all UBX-NAV-PVT messages at once
+    @param data: numpy array of bytes
+    @return: numpy array with PVT_DTYPE and offset where scanning can resume (see scan)
+    """
+    frames, end = scan(data, start)
+    offsets = np.array([offset for msgid, offset, length in frames if msgid == UBX_NAV_PVT and length >= PVT_DTYPE.itemsize], dtype=np.int64)
+    if len(offsets) == 0:
+        return np.zeros(0, dtype=PVT_DTYPE), end
+    index = offsets[:, np.newaxis] + np.arange(PVT_DTYPE.itemsize)
+    return np.ascontiguousarray(data[index]).view(PVT_DTYPE).ravel(), end
+
+def fixes(pvt):
+    """
+    @summary: select valid 3D fixes and convert to the fields of NavPVT
+    @param pvt: numpy array with PVT_DTYPE
+    @return: Pandas dataframe with columns timestamp, lat, lon, alt, msl, hAcc, vAcc, numSV and pDOP in file order
+    """
+    pvt = pvt[(pvt['valid'] != 0) & (pvt['fixType'] == 3)]
+    timestamp = pd.to_datetime(pd.DataFrame({
+        'year': pvt['year'], 'month': pvt['month'], 'day': pvt['day'],
+        'hour': pvt['hour'], 'minute': pvt['min'], 'second': pvt['sec']}), errors='coerce', utc=True)
+    df = pd.DataFrame({
+        'timestamp': timestamp,
+        'lat': pvt['lat'] * 1e-7,
+        'lon': pvt['lon'] * 1e-7,
+        'alt': pvt['height'],
+        'msl': pvt['hMSL'],
+        'hAcc': pvt['hAcc'],
+        'vAcc': pvt['vAcc'],
+        'numSV': pvt['numSV'],
+        'pDOP': pvt['pDOP'] * 1e-2,
+        }, columns=['timestamp','lat','lon','alt','msl','hAcc','vAcc','numSV','pDOP'])
+    return df.dropna(subset=['timestamp'])
+
+def iterpvt(ubx):
+    """ generates dicts with the fields of NavPVT for valid 3D fixes in a ubx file """
+    pvt, _end = navpvt(read(ubx))
+    df = fixes(pvt)
+    for row in df.itertuples(index=False):
+        fields = dict(zip(df.columns, row))
+        fields['timestamp'] = fields['timestamp'].to_pydatetime()
+        for name in ('alt','msl','hAcc','vAcc','numSV'):
+            fields[name] = int(fields[name])
+        yield fields
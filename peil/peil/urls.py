@@ -22,13 +22,14 @@ from peil.views import DeviceListView, MapView, json_locations,\
     chart_as_csv, data_as_csv, PhotoView, PostView, select_photo, to_csv, kpn
 from django.views.decorators.cache import cache_page
 from peil.api import DeviceResource, SensorResource, MessageResource,\
-    BatteryResource
+    BatteryResource, RollupResource
 
 v1 = Api(api_name='v1')
 v1.register(DeviceResource())
 v1.register(SensorResource())
 v1.register(MessageResource())
 v1.register(BatteryResource())
+v1.register(RollupResource())
 
 urlpatterns = [
     url(r'^$', MapView.as_view(), name='home'),
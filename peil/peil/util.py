@@ -5,68 +5,93 @@ from django.http.response import HttpResponse, HttpResponseServerError
 import datetime, pytz
 import logging
 import os, re
+import threading
+import base64, binascii
 import numpy as np
 import pandas as pd
 
-from .models import Device, GNSS_MESSAGE, EC_MESSAGE, STATUS_MESSAGE, PRESSURE_MESSAGE, ANGLE_MESSAGE
-from peil.models import PressureSensor,PressureMessage, GNSS_Sensor, BatterySensor, StatusMessage, \
-    AngleSensor, InclinationMessage, LocationMessage, ECSensor, ECMessage, UBXFile
+from .models import Device
+from peil.models import UBXFile
 from datetime import timedelta
 from peil.sensor import create_sensors
 from peil.decoder import decode
+from peil.ingest import parse_payloads
+from peil.lookup import resolver
+from peil import aggregate, rollup, ublox
 
 logger = logging.getLogger(__name__)
 
-def get_raw_sensor_data(device, sensor_name, **kwargs):
+def get_raw_sensor_data(device, sensor_name, start=None, stop=None, **kwargs):
     """ 
     @return: Pandas dataframe with timeseries of raw sensor data
     @param device: the device to query 
+    @param start: optional start time (inclusive)
+    @param stop: optional stop time (exclusive)
     """  
     try:
         columns = kwargs.pop('columns',None)
-        data = device.get_sensor(sensor_name,**kwargs).raw_data()
-        df = pd.DataFrame(data).set_index('time')
-        df = df.where(df<4096,np.nan).resample('H').mean() # clear extreme values and resample on every hour
+        # clear extreme values and aggregate on every hour in the database
+        df = aggregate.raw_series(device.get_sensor(sensor_name,**kwargs), 'hour', start, stop, limit=4096)
         return df.rename(columns=columns) if columns else df
     except:
         return pd.DataFrame()
 
-def get_raw_data(device, **kwargs):
+def get_raw_data(device, start=None, stop=None):
     """ 
     @return: Pandas dataframe with timeseries of all raw sensor data
     @param device: the device to query 
+    @param start: optional start time (inclusive)
+    @param stop: optional stop time (exclusive)
     """  
-    bat = get_raw_sensor_data(device,'Batterij',position=0,columns={'battery': 'BAT'})
-    ec1 = get_raw_sensor_data(device,'EC1',position=1,columns={'adc1': 'EC1-ADC1', 'adc2': 'EC1-ADC2', 'temperature': 'EC1-TEMP'})
-    ec2 = get_raw_sensor_data(device,'EC2',position=2,columns={'adc1': 'EC2-ADC1', 'adc2': 'EC2-ADC2', 'temperature': 'EC2-TEMP'})
-    p1 = get_raw_sensor_data(device,'Luchtdruk',position=0,columns={'adc': 'PRES0-ADC'})
-    p2 = get_raw_sensor_data(device,'Waterdruk',position=3,columns={'adc': 'PRES3-ADC'})
+    bat = get_raw_sensor_data(device,'Batterij',start,stop,position=0,columns={'battery': 'BAT'})
+    ec1 = get_raw_sensor_data(device,'EC1',start,stop,position=1,columns={'adc1': 'EC1-ADC1', 'adc2': 'EC1-ADC2', 'temperature': 'EC1-TEMP'})
+    ec2 = get_raw_sensor_data(device,'EC2',start,stop,position=2,columns={'adc1': 'EC2-ADC1', 'adc2': 'EC2-ADC2', 'temperature': 'EC2-TEMP'})
+    p1 = get_raw_sensor_data(device,'Luchtdruk',start,stop,position=0,columns={'adc': 'PRES0-ADC'})
+    p2 = get_raw_sensor_data(device,'Waterdruk',start,stop,position=3,columns={'adc': 'PRES3-ADC'})
     return pd.concat([bat,ec1,ec2,p1,p2],axis=1)
 
-def get_sensor_series(device, sensor_name, **kwargs):
-    ''' returns pandas series with calibrated sensor data '''
+def get_sensor_series(device, sensor_name, start=None, stop=None, **kwargs):
+    ''' returns pandas series with hourly mean of calibrated sensor data between start (inclusive) and stop (exclusive) '''
     try:
-        t,x=zip(*list(device.get_sensor(sensor_name,**kwargs).data()))       
-        return pd.Series(x,index=t).resample(rule='H').mean()
+        sensor = device.get_sensor(sensor_name,**kwargs)
+        # rollups are only used for the period where they are complete
+        since = sensor.rollups_since if getattr(settings,'USE_ROLLUPS',True) else None
+        if since is None or (stop is not None and stop <= since):
+            series = aggregate.calibrated_series(sensor, 'hour', start, stop)
+        elif start is not None and start >= since:
+            series = rollup.series(sensor, 'H', start, stop)
+        else:
+            before = aggregate.calibrated_series(sensor, 'hour', start, since)
+            after = rollup.series(sensor, 'H', since, stop)
+            if before.empty:
+                series = after
+            elif after.empty:
+                series = before
+            else:
+                series = pd.concat([before, after])
+        if series.empty:
+            return series
+        # hours without messages are NaN in both sources
+        return series.resample('H').mean()
     except Exception as e:
         logger.error('ERROR loading sensor data for {}: {}'.format(sensor_name,e))
         return pd.Series()
 
-def get_ec_series(device):
+def get_ec_series(device, start=None, stop=None):
     """ 
     @return: Pandas dataframe with timeseries of EC
     @param device: the device to query 
     """  
-    return pd.DataFrame({'EC1':get_sensor_series(device,'EC1',position=1),
-                         'EC2': get_sensor_series(device,'EC2',position=2)})
+    return pd.DataFrame({'EC1':get_sensor_series(device,'EC1',start,stop,position=1),
+                         'EC2': get_sensor_series(device,'EC2',start,stop,position=2)})
 
-def get_level_series(device):
+def get_level_series(device, start=None, stop=None):
     """ 
     @return: Pandas dataframe with timeseries of water level
     @param device: the device to query 
     """  
-    waterpressure=get_sensor_series(device,'Waterdruk',position=3)
-    airpressure=get_sensor_series(device,'Luchtdruk',position=0)
+    waterpressure=get_sensor_series(device,'Waterdruk',start,stop,position=3)
+    airpressure=get_sensor_series(device,'Luchtdruk',start,stop,position=0)
     # take the nearest air pressure values within a range of 2 hours from the time of water pressure measurements
     airpressure = airpressure.reindex(waterpressure.index,method='nearest',tolerance='2h')
     # calculate water level in cm above the sensor
@@ -81,65 +106,66 @@ def get_level_series(device):
     # convert to water level in cm to meter to NAP
     return pd.DataFrame({'Waterhoogte': waterlevel, 'Waterpeil': waterlevel/100.0 + elevation})
     
-def get_chart_series(device):
+def get_chart_series(device, start=None, stop=None):
     """ 
     @return: Pandas dataframe with timeseries of EC and water level
     @param device: the device to query 
+    @param start: optional start time (inclusive)
+    @param stop: optional stop time (exclusive)
     @summary: Query a device for EC and water level resampled per hour
     """  
-    ecdata = get_ec_series(device)
-    wldata = get_level_series(device)
+    ecdata = get_ec_series(device, start, stop)
+    wldata = get_level_series(device, start, stop)
     df = pd.concat([ecdata,wldata],axis=1)
     df.index.rename('Datum',inplace=True)
     return df
 
 def last_waterlevel(device, hours=2):
     """ returns last known waterlevel for a device """
-    wps = device.get_sensor('Waterdruk',position=3)
-    wp = wps.last_message()
-    if wp:
-        aps = device.get_sensor('Luchtdruk',position=0)
-        ap = aps.last_message()
-        if ap:
-            # we have some air pressure and water pressure messages, 
-            # now check if messages were sent within time tolerance
-            tolerance = timedelta(hours=hours)
-            if wp.time > ap.time:
-                delta = wp.time - ap.time 
+    wp = device.get_latest('Waterdruk',position=3)
+    ap = device.get_latest('Luchtdruk',position=0)
+    if wp and ap:
+        # we have some air pressure and water pressure messages, 
+        # now check if messages were sent within time tolerance
+        tolerance = timedelta(hours=hours)
+        time = wp.time
+        water = wp.value
+        air = ap.value
+        if wp.time > ap.time:
+            delta = wp.time - ap.time 
+        else:
+            delta = ap.time - wp.time
+    
+        if delta > tolerance:
+            # tolerance exceeded.
+            if ap.time < wp.time:
+                # find last water pressure within tolerance
+                fromtime = ap.time - tolerance
+                wps = device.get_sensor('Waterdruk',position=3)
+                msg = wps.loramessage_set.filter(time__gte=fromtime).last()
+                time, water = (msg.time, wps.value(msg)) if msg else (None, None)
             else:
-                delta = ap.time - wp.time
+                # find last air pressure within tolerance
+                fromtime = wp.time - tolerance
+                aps = device.get_sensor('Luchtdruk',position=0)
+                msg = aps.loramessage_set.filter(time__gte=fromtime).last()
+                air = aps.value(msg) if msg else None
         
-            if delta > tolerance:
-                # tolerance exceeded.
-                if ap.time < wp.time:
-                    # find last water pressure within tolerance
-                    fromtime = ap.time - tolerance
-                    wp = wps.loramessage_set.filter(time__gte=fromtime).last()
-                else:
-                    # find last air pressure within tolerance
-                    fromtime = wp.time - tolerance
-                    ap = aps.loramessage_set.filter(time__gte=fromtime).last()
-            
-            if ap and wp:
-                air = aps.value(ap)
-                water = wps.value(wp)
-                if air and water:
-                    level = (water - air) / 0.980638 # convert hPa to cm water column
-                    z = wps.elevation()
-                    nap = None if z is None else level/100 + z
-                    return {'time': wp.time, 'cm': level, 'nap': nap}
+        if air and water:
+            level = (water - air) / 0.980638 # convert hPa to cm water column
+            z = wp.sensor.elevation()
+            nap = None if z is None else level/100 + z
+            return {'time': time, 'cm': level, 'nap': nap}
     return {}
 
 def last_ec(device):
     """ returns last known electrical conductivity for a device """
 
     def last(name,pos):
-        try:
-            sensor = device.get_sensor(name,position=pos)
-            message = sensor.last_message()
-            return {'sensor': sensor, 'time': message.time, 'value': sensor.value(message)}
-        except:
-            return {}
+        latest = device.get_latest(name,position=pos)
+        if latest:
+            return {'sensor': latest.sensor, 'time': latest.time, 'value': latest.value}
+        return {}
     return {'EC1': last('EC1',1),
             'EC2': last('EC2',2)}
     
@@ -165,110 +191,105 @@ def battery_status(battery):
     return {'level': level, 'icon': icon} 
     
 def parse_payload(device,server_time,payload,orion=None):
-    message_type = payload['type']
-    msg = None
-    
-    def logsens(sensor, created):
-        if created:
-            logger.info('{}: {} sensor created'.format(sensor.device, sensor))
-    
-    def logmsg(msg, created):
-        logger.debug('{}: {} {}. time={}'.format(msg.sensor.device, unicode(msg), 'added' if created else 'updated', msg.time ))
-        if orion:
-            orion.update_message(msg)
-        
-    if message_type == STATUS_MESSAGE:
-
-        sensor, created = PressureSensor.objects.get_or_create(device=device,position=0,defaults={'ident':'Luchtdruk'})
-        logsens(sensor, created)
-
-        msg, created = PressureMessage.objects.update_or_create(sensor=sensor, time = server_time, defaults = {'adc': payload['pressure']})
-        logmsg(msg,created)
-        
-        sensor, created = BatterySensor.objects.get_or_create(device=device,position=0,defaults={'ident':'Batterij'})
-        logsens(sensor, created)
-        
-        msg, created = StatusMessage.objects.update_or_create(sensor=sensor, time = server_time, defaults= {'battery': payload['battery']})
-        logmsg(msg,created)
-
-        sensor, created = AngleSensor.objects.get_or_create(device=device,position=0,defaults={'ident':'Inclinometer'})
-        logsens(sensor, created)
-
-        msg, created = InclinationMessage.objects.update_or_create(sensor=sensor, time = server_time, defaults = {'angle': payload['angle']})
-        logmsg(msg,created)
-        
-    elif message_type == GNSS_MESSAGE:
-
-        sensor, created = GNSS_Sensor.objects.get_or_create(device=device,position=0,defaults={'ident':'GPS'})
-        logsens(sensor, created)
-        msg, created = LocationMessage.objects.update_or_create(sensor=sensor, time = server_time, defaults = { 
-            'lat': payload['latitude'],
-            'lon': payload['longitude'],
-            'alt': payload['height'],
-            'vacc': payload['vAcc'],
-            'hacc': payload['hAcc'],
-            'msl': payload['hMSL']})
-        logmsg(msg,created)
-        
-    elif message_type == EC_MESSAGE:
-        pos = payload['position']
-        sensor, created = ECSensor.objects.get_or_create(device = device, position=pos,defaults={'ident':'EC'+str(pos)})
-        logsens(sensor, created)
-        msg, created = ECMessage.objects.update_or_create(sensor=sensor, time=server_time, defaults = {
-            'adc1': payload['ec1'],
-            'adc2': payload['ec2'],
-            'temperature': payload['temperature']})
-        logmsg(msg,created)
-
-    elif message_type == PRESSURE_MESSAGE:
-        sensor, created = PressureSensor.objects.get_or_create(device = device, position=payload['position'],defaults={'ident':'Waterdruk'})
-        logsens(sensor, created)
-        msg, created = PressureMessage.objects.update_or_create(sensor=sensor, time=server_time, defaults = {'adc': payload['pressure']})
-        logmsg(msg,created)
-
-    elif message_type == ANGLE_MESSAGE:
-        sensor, created = AngleSensor.objects.get_or_create(device=device,position=0,defaults={'ident':'Inclinometer'})
-        logsens(sensor, created)
-        msg, created = InclinationMessage.objects.update_or_create(sensor=sensor, time = server_time, defaults = {'angle': payload['angle']})
-        logmsg(msg,created)
-    
-    else:
-        raise Exception('Unknown message type:'+ str(message_type))
-    
+    """ store a single decoded payload. Use parse_payloads() for batches """
+    result = parse_payloads([(device, server_time, payload)], orion)
+    msg = result[-1][0] if result else None
     return msg, True, False
 
-def parse_ttn(ttn):
-    """ parse json pushed from ttn server """
-    try:
-        serial = ttn['hardware_serial']
-        devid = ttn['dev_id']
-        #appid = ttn['app_id']
-        meta = ttn['metadata']
-        server_time = parse_datetime(meta['time'])
-        pf = ttn['payload_fields']
-    except Exception as e:
-        logger.error('Error parsing payload {}\n{}'.format(ttn,e))
-        raise e
+_orion = None
 
-    try:
-        if settings.USE_ORION:
+def get_orion():
+    """ returns Orion instance when updates to the context broker are enabled.
+        The instance is shared, so connections to the context broker are reused between requests
+    """
+    global _orion
+    if settings.USE_ORION:
+        if _orion is None:
             from peil.fiware import Orion
-            orion = Orion(settings.ORION_URL)
-        else:
-            orion = None
+            _orion = Orion(settings.ORION_URL)
+        return _orion
+    return None
 
-        device, created = Device.objects.update_or_create(serial=serial,devid=devid, defaults={'last_seen': server_time})
-        if created:
+def update_devices(keys, orion=None, fields=('serial','devid')):
+    """ 
+    @summary: find or create devices for a batch of messages and update last_seen
+    @param keys: dict of tuples with values of fields to last server time 
+    @return: dict of key to Device
+    """
+    devices = {}
+    missing = []
+    for key in keys:
+        device = resolver.get_device(**dict(zip(fields,key)))
+        if device is None:
+            missing.append(key)
+        else:
+            devices[key] = device
+    if missing:
+        lookup = {fields[-1]+'__in': set(key[-1] for key in missing)}
+        for device in Device.objects.filter(**lookup):
+            key = tuple(getattr(device, f) for f in fields)
+            if key in keys:
+                devices[key] = device
+                resolver.set_device(device, **dict(zip(fields,key)))
+
+    for key, server_time in keys.items():
+        device = devices.get(key)
+        if device is None:
+            device = Device.objects.create(last_seen=server_time, **dict(zip(fields,key)))
             logger.debug('device {} created'.format(unicode(device)))
             if orion:
                 orion.create_device(device)
+            devices[key] = device
+        elif device.last_seen is None or device.last_seen < server_time:
+            device.last_seen = server_time
+            Device.objects.filter(pk=device.pk).update(last_seen=server_time)
+    return devices
+
+def ttn_row(ttn):
+    """ returns device key (serial, devid), server time and decoded payload of a json message pushed from ttn server """
+    key = (ttn['hardware_serial'], ttn['dev_id'])
+    meta = ttn['metadata']
+    server_time = parse_datetime(meta['time'])
+    pf = ttn.get('payload_fields')
+    if not pf:
+        # not decoded by ttn
+        pf = decode(binascii.b2a_hex(base64.b64decode(ttn['payload_raw'])))
+    return key, server_time, pf
+
+def store_rows(rows, orion=None):
+    """ 
+    @summary: store a batch of messages
+    @param rows: list of (device key, server time, payload) tuples as returned by ttn_row()
+    @return: list of (message, created) tuples
+    """
+    keys = {}
+    for key, server_time, _pf in rows:
+        if key not in keys or keys[key] < server_time:
+            keys[key] = server_time
+    devices = update_devices(keys, orion)
+    return parse_payloads([(devices[key], server_time, pf) for key, server_time, pf in rows], orion)
+
+def parse_ttns(ttns, orion=None):
+    """ parse a batch of json messages pushed from ttn server """
+    rows = []
+    for ttn in ttns:
+        try:
+            rows.append(ttn_row(ttn))
+        except Exception as e:
+            logger.error('Error parsing payload {}\n{}'.format(ttn,e))
+            raise e
 
-        mod, created, updated = parse_payload(device, server_time, pf, orion)
-
-        return mod, created, updated
+    try:
+        return store_rows(rows, orion)
     except Exception as e:
-        logger.exception('Error parsing payload: {}'.format(ttn))
+        logger.exception('Error parsing payloads')
         raise e
+
+def parse_ttn(ttn):
+    """ parse json pushed from ttn server """
+    result = parse_ttns([ttn], get_orion())
+    mod = result[-1][0] if result else None
+    return mod, True, False
     
 def handle_post_data(json):
     try:
@@ -277,47 +298,50 @@ def handle_post_data(json):
     except Exception as e:
         return HttpResponseServerError(e)
 
-def parse_kpn(xml):
-    """ parse xml pushed from kpn server """
+def kpn_row(xml):
+    """ returns serial, server time and hex payload of xml pushed from kpn server """
     import xml.etree.ElementTree as ET
-    try:
-        ns = {'lora':'http://uri.actility.com/lora'}
-        tree = ET.fromstring(xml)
-        serial = tree.find('lora:DevEUI',ns).text
-        time = tree.find('lora:Time',ns).text
-        hex = tree.find('lora:payload_hex',ns).text
-        
-        logger.debug('KPN Post: time={}, serial={}, payload={}'.format(time,serial,hex)) 
-
-        time = parse_datetime(time)
-        payload = decode(hex)
-    except Exception as e:
-        logger.error('Error parsing payload {}\n{}'.format(xml,e))
-        raise e
-
-    try:
-        if settings.USE_ORION:
-            from peil.fiware import Orion
-            orion = Orion(settings.ORION_URL)
-        else:
-            orion = None
-
+    ns = {'lora':'http://uri.actility.com/lora'}
+    tree = ET.fromstring(xml)
+    serial = tree.find('lora:DevEUI',ns).text
+    time = tree.find('lora:Time',ns).text
+    hex = tree.find('lora:payload_hex',ns).text
+    return serial, parse_datetime(time), hex
+
+def kpn_device(serial, time, orion=None):
+    """ find or create device with serial for a message received from kpn at time and update last_seen """
+    device = resolver.get_device(serial=serial)
+    if device is None:
         device, created = Device.objects.get_or_create(serial=serial,defaults={
             'devid': 'peilstok{}'.format(serial),
             'displayname':'Peilstok_{}'.format(serial),
             'last_seen': time})
-
-        if not created:
-            device.last_seen=time
-            device.save()
-        else:
+        if created:
             logger.debug('device {} created'.format(unicode(device)))
             create_sensors(device)
             if orion:
                 orion.create_device(device)
+        resolver.set_device(device, serial=serial)
 
-        mod, created, updated = parse_payload(device, time, payload, orion)
+    if device.last_seen is None or device.last_seen < time:
+        device.last_seen = time
+        Device.objects.filter(pk=device.pk).update(last_seen=time)
+    return device
 
+def parse_kpn(xml):
+    """ parse xml pushed from kpn server """
+    try:
+        serial, time, hex = kpn_row(xml)
+        logger.debug('KPN Post: time={}, serial={}, payload={}'.format(time,serial,hex)) 
+        payload = decode(hex)
+    except Exception as e:
+        logger.error('Error parsing payload {}\n{}'.format(xml,e))
+        raise e
+
+    try:
+        orion = get_orion()
+        device = kpn_device(serial, time, orion)
+        parse_payloads([(device, time, payload)], orion)
         return payload, True, False
     except Exception as e:
         logger.exception('Error parsing payload: {}'.format(payload))
@@ -330,58 +354,24 @@ def handle_kpn_post_data(json):
     except Exception as e:
         return HttpResponseServerError(e)
 
-def handle_post_data_async(json):
-    # start background process that handles post data from TTN server
-    from threading import Thread
-    t = Thread(target=parse_ttn, args=[json,])
-    t.start()
-    return t
+def iterpvt(ubx):
+    """ iterate over ubx file and yield navpvt fields of valid 3D fixes """
+    return ublox.iterpvt(ubx)
 
-UBX_HEADER = 0x62B5
-UBX_NAV_PVT = 0x0701
+def ubxscan(ubx, offset=0):
+    """
+    @summary: find time of first and last observation in ubxfile, starting at offset
+    @return: start, stop and offset where the next scan can resume when data is appended to the file
+    """
+    pvt, end = ublox.navpvt(ublox.read(ubx), offset)
+    df = ublox.fixes(pvt)
+    if df.empty:
+        return None, None, end
+    return df.timestamp.iloc[0].to_pydatetime(), df.timestamp.iloc[-1].to_pydatetime(), end
 
-def iterpvt(ubx):
-    """ iterate over ubx file and yield navpvt instances """
-    import struct
-
-    def decode(data):
-        iTOW, year, month, day, hour, min, sec, valid, tAcc, nano, fixType, flags, reserved1, \
-            numSV, lon, lat, height, hMSL, hAcc, vAcc, velN, velE, velD, gSpeed, heading, sAcc, \
-            headingAcc, pDOP, reserved2, reserved3 = struct.unpack('<IHBBBBBbIiBbBBiiiiIIiiiiiIIHHI', data)
-        return valid, fixType, {'timestamp': datetime.datetime(year, month, day, hour, min, sec, tzinfo = pytz.utc),
-                'lat': lat*1e-7, 
-                'lon': lon*1e-7,
-                'alt': height, 
-                'msl' : hMSL, 
-                'hAcc': hAcc,
-                'vAcc': vAcc,
-                'numSV': numSV,
-                'pDOP': pDOP*1e-2}
-
-    while True:
-        data=ubx.read(6)
-        if len(data) != 6:
-            break
-        hdr, msgid, length = struct.unpack('<HHH',data) 
-        if hdr != UBX_HEADER:
-            raise ValueError('UBX header tag expected')
-        data = ubx.read(length)
-        checksum = ubx.read(2) # TODO verify checksum
-        if msgid == UBX_NAV_PVT:
-            valid, fix, fields = decode(data)
-            if valid and fix == 3: # Allow only valid 3D fixes
-                yield fields
-                
 def ubxtime(ubx):
     """ return time of first and last observation in ubxfile """
-    ubx.seek(0)
-    start = stop = None
-    for pvt in iterpvt(ubx):
-        time = pvt['timestamp']
-        if start == None:
-            start = stop = time
-        else:
-            stop = time
+    start, stop, _end = ubxscan(ubx)
     return start, stop
  
 def add_ubx(ubxfile):
@@ -424,19 +414,33 @@ def time2gps(time):
     dow = int(tow / 86400) # day of week
     return week, dow, tow
 
-class TransNAP:
-    ''' transform 3D coordinates from WGS84 to RDNAP '''
+class TransNAP(object):
+    ''' transform 3D coordinates from WGS84 to RDNAP. OGR transformations are not thread-safe, every thread creates its own '''
   
     def __init__(self):
-        import osr
-
-        wgs = osr.SpatialReference()
-        wgs.ImportFromProj4('+init=epsg:4326') # should be 4979, but this works as well
-        #wgs.ImportFromProj4('+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs')
-        rd = osr.SpatialReference()
-        rd.ImportFromProj4('+init=rdnap:rdnap')
-        self.fwd = osr.CoordinateTransformation(wgs,rd)
-        self.inv = osr.CoordinateTransformation(rd,wgs)
+        self.local = threading.local()
+        
+    def transformations(self):
+        local = self.local
+        if not hasattr(local, 'fwd'):
+            import osr
+    
+            wgs = osr.SpatialReference()
+            wgs.ImportFromProj4('+init=epsg:4326') # should be 4979, but this works as well
+            #wgs.ImportFromProj4('+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs')
+            rd = osr.SpatialReference()
+            rd.ImportFromProj4('+init=rdnap:rdnap')
+            local.fwd = osr.CoordinateTransformation(wgs,rd)
+            local.inv = osr.CoordinateTransformation(rd,wgs)
+        return local.fwd, local.inv
+
+    @property
+    def fwd(self):
+        return self.transformations()[0]
+
+    @property
+    def inv(self):
+        return self.transformations()[1]
     
     def to_rdnap(self,x,y,z):
         return self.fwd.TransformPoint(x,y,z)
@@ -444,6 +448,19 @@ class TransNAP:
     def to_wgs84(self,x,y,z):
         return self.inv.TransformPoint(x,y,z)
 
+    def to_rdnap_many(self,lon,lat,h,chunk=100000):
+        """
+        @summary: transform arrays of coordinates with OGR TransformPoints
+        @param chunk: maximum number of points per call, limits the size of the intermediate lists
+        @return: numpy array with shape (n,3)
+        """
+        points = np.column_stack((lon,lat,h)).astype(float)
+        result = np.zeros((len(points),3))
+        fwd = self.fwd
+        for start in range(0, len(points), chunk):
+            result[start:start+chunk] = fwd.TransformPoints(points[start:start+chunk].tolist())
+        return result
+
 rdnap = TransNAP()
 
 def download(url,dest):
@@ -451,7 +468,8 @@ def download(url,dest):
     import ftplib
     from urlparse import urlparse
     res = urlparse(url)
-    ftp = ftplib.FTP(res.hostname)
+    ftp = ftplib.FTP()
+    ftp.connect(res.hostname, res.port or 21)
     ftp.login()
     destdir = os.path.dirname(dest)
     if not os.path.exists(destdir):
@@ -460,24 +478,18 @@ def download(url,dest):
         with open(dest,"wb") as f:
             def save(data):
                 f.write(data)
-            response = ftp.retrbinary("RETR "+res.path, callback=save, blocksize=1024)
+            response = ftp.retrbinary("RETR "+res.path, callback=save, blocksize=65536)
             return True
     except:
         os.remove(dest)
         return False
+    finally:
+        ftp.close()
 
 def getfile(root,path,remote):
-    """ get local file root/path. Download from remote if file does not exist """ 
-    local_file = os.path.join(root,path)
-    if not os.path.exists(local_file):
-        logger.debug('Downloading {} from {}'.format(path,remote))
-        try:
-            if not download(remote + path, local_file):
-                logger.debug('Download failed')
-                return None
-        except Exception as e:
-            logger.exception('Download failed: '+e)
-    return local_file
+    """ get local file root/path. Download from remote if file does not exist or is corrupt """ 
+    from peil.corrections import fetch
+    return fetch(root,path,remote)
 
 def get_broadcast_files(time, satcodes='G'):
     """ Gets broadcast files for the day of given time stamp. Download if they do not exist. 
@@ -516,19 +528,25 @@ def get_ephemeres_files(time, types = ['clk','sp3','erp'], products='sru'):
         # final not available
         products = products.replace('s','')
     
+    def product_path(product, _type):
+        if product == 'u':
+            hour = (time.hour // 6) * 6 # 0, 6, 12, 18
+            return '{week}/ig{product}{week}{dow}_{hour:02}.{type}.Z'.format(week=week,dow=dow,hour=hour,product=product,type=_type)
+        else:
+            return '{week}/ig{product}{week}{dow}.{type}.Z'.format(week=week,dow=dow,product=product,type=_type)
+
+    from peil.corrections import discard
     files = []
     url = 'ftp://ftp.igs.org/pub/product/'
     for _type in types:
+        # products are ordered from best (final) to worst (ultra rapid)
         for product in products:
-            if product == 'u':
-                hour = (time.hour // 6) * 6 # 0, 6, 12, 18
-                path = '{week}/ig{product}{week}{dow}_{hour:02}.{type}.Z'.format(week=week,dow=dow,hour=hour,product=product,type=_type)
-            else:
-                path = '{week}/ig{product}{week}{dow}.{type}.Z'.format(week=week,dow=dow,product=product,type=_type)
-            local_file = getfile(settings.GNSS_ROOT,path,url)
+            local_file = getfile(settings.GNSS_ROOT,product_path(product,_type),url)
             if not local_file:
                 continue
             files.append(local_file)
+            # remove cached products that have been superseded
+            discard(settings.GNSS_ROOT, [product_path(p,_type) for p in 'sru'['sru'.index(product)+1:]])
             break
     return files
 
@@ -10,12 +10,14 @@ from django.views.generic.detail import DetailView
 from django.views.generic.list import ListView
 from django.views.decorators.gzip import gzip_page
 from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware
 
-import re, time
+import re, calendar, datetime, pytz
 import simplejson as json # allows for NaN conversion
 import numpy as np
 from peil.models import Device, UBXFile, RTKSolution, Photo
-from peil import util
+from peil import util, locations, downsample, archive, inbox
 
 import logging
 from django.shortcuts import get_object_or_404, redirect
@@ -38,21 +40,20 @@ class StaffRequiredMixin(object):
             return redirect(settings.LOGIN_URL)
         return super(StaffRequiredMixin, self).dispatch(request, *args, **kwargs)
         
+def epoch_ms(value):
+    """ json encoding of datetimes for highcharts: milliseconds since 1970-01-01 UTC, like downsample.points. Charts show UTC """
+    return calendar.timegm(value.utctimetuple())*1000.0
+
 def json_locations(request):
     """ return json response with last known peilstok locations
         optionally filter messages on hacc (in mm)
     """
-    result = []
-    hacc = request.GET.get('hacc',10000)
-    for p in Device.objects.all():
-        try:
-            loc = p.current_location(hacc)
-            if loc:
-                result.append(loc)
-        except Exception as e:
-            print e
-            pass
-    return HttpResponse(json.dumps(result, ignore_nan = True, default=lambda x: time.mktime(x.timetuple())*1000.0), content_type='application/json')
+    try:
+        hacc = int(request.GET.get('hacc',10000))
+    except ValueError:
+        return HttpResponseBadRequest('hacc must be an integer')
+    result = locations.cached_locations(hacc)
+    return HttpResponse(json.dumps(result, ignore_nan = True, default=epoch_ms), content_type='application/json')
 
 @staff_member_required
 def select_photo(request, pk):
@@ -84,6 +85,16 @@ class PopupView(DetailView):
             pass
         return context
 
+def enqueue(source, body):
+    """ validate uplink and add it to the queue of manage.py ingest_worker """
+    try:
+        inbox.validate(source, body)
+    except ValueError as e:
+        logger.error(e)
+        return HttpResponseBadRequest(str(e))
+    inbox.enqueue(source, body)
+    return HttpResponse('Queued',status=202)
+
 @csrf_exempt
 def kpn(request):
     """ handle post data from KPN server and update database """
@@ -91,6 +102,9 @@ def kpn(request):
         try:
             logger.debug('KPN Post received')
             data = request.body
+            if getattr(settings,'INGEST_QUEUE',False):
+                return enqueue('kpn', data)
+            archive.store('kpn', data)
             return util.handle_kpn_post_data(data)
         except:
             logger.exception('Cannot parse POST data')
@@ -103,6 +117,9 @@ def ttn(request):
     if request.method == 'POST':
         try:
             logger.debug('TTN Post received')
+            if getattr(settings,'INGEST_QUEUE',False):
+                return enqueue('ttn', request.body)
+            archive.store('ttn', request.body)
             data = json.loads(request.body)
             return util.handle_post_data(data)
         except:
@@ -135,6 +152,8 @@ def ubx(request):
             # append to existing file
             with open(path, "ab") as f:
                 f.write(file.read())
+            # scan appended data for start and stop
+            ubx.save(update_fields=['start','stop','offset'])
 
             # remove existing nav messages
             # ubx.navpvt_set.all().delete()
@@ -187,6 +206,7 @@ class DeviceDetailView(StaffRequiredMixin,NavDetailView):
     def get_context_data(self, **kwargs):
         context = super(DeviceDetailView, self).get_context_data(**kwargs)
         device = self.get_object()
+        context['sensors'] = device.sensor_set.select_related('latest')
         try:
             context['battery'] = device.battery_status()
         except:
@@ -197,17 +217,57 @@ class DeviceDetailView(StaffRequiredMixin,NavDetailView):
             pass
         return context
     
+def parse_time(value):
+    """ parse time from milliseconds since 1970-01-01 (like highcharts) or ISO 8601 string. Naive times are UTC """
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromtimestamp(float(value)/1000.0, pytz.utc)
+    except ValueError:
+        pass
+    result = parse_datetime(value)
+    if result is None:
+        raise ValueError('Invalid time: {}'.format(value))
+    if is_naive(result):
+        result = make_aware(result, pytz.utc)
+    return result
+
+def chart_query(request):
+    """
+    @summary: get time range and downsampling from query parameters start, stop, max_points and method
+    @return: tuple of start, stop, max_points and method
+    @raise ValueError: when a parameter is invalid
+    """
+    start = parse_time(request.GET.get('start'))
+    stop = parse_time(request.GET.get('stop'))
+    max_points = int(request.GET.get('max_points', getattr(settings,'CHART_MAX_POINTS',1000)))
+    if max_points < 0:
+        raise ValueError('max_points must not be negative')
+    method = request.GET.get('method','lttb')
+    if method not in downsample.METHODS:
+        raise ValueError('method must be one of {}'.format(', '.join(downsample.METHODS)))
+    return start, stop, max_points, method
+
+def series_as_json(pts, columns, max_points, method):
+    """ convert columns of a dataframe to json for highcharts, downsampled to at most max_points per series """
+    data = {}
+    for key, column in columns.items():
+        data[key] = downsample.points(pts[column], max_points, method) if column in pts else []
+    return HttpResponse(json.dumps(data, ignore_nan = True), content_type='application/json')
+
 @gzip_page
 def chart_as_json(request,pk):
-    """ get chart data as json array for highcharts """
+    """ get chart data as json array for highcharts.
+        Optional query parameters: start and stop (milliseconds since 1970-01-01 or ISO 8601),
+        max_points (maximum number of points per series, 0 = all) and method (lttb or minmax)
+    """
     device = get_object_or_404(Device, pk=pk)
-    pts = util.get_chart_series(device)
-    data = {'EC1': zip(pts.index,pts['EC1']),        
-            'EC2': zip(pts.index,pts['EC2']),
-            'NAP': zip(pts.index,pts['Waterpeil']),
-            'H': zip(pts.index,pts['Waterhoogte'])
-            }
-    return HttpResponse(json.dumps(data, ignore_nan = True, default=lambda x: time.mktime(x.timetuple())*1000.0), content_type='application/json')
+    try:
+        start, stop, max_points, method = chart_query(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    pts = util.get_chart_series(device, start, stop)
+    return series_as_json(pts, {'EC1': 'EC1', 'EC2': 'EC2', 'NAP': 'Waterpeil', 'H': 'Waterhoogte'}, max_points, method)
 
 @gzip_page
 def chart_as_csv(request,pk):
@@ -241,22 +301,24 @@ def to_csv(request):
     
 @gzip_page
 def data_as_json(request,pk):
-    """ get raw sensor data as json array for highcharts """
+    """ get raw sensor data as json array for highcharts. Accepts the same query parameters as chart_as_json """
     device = get_object_or_404(Device, pk=pk)
-    pts = util.get_raw_data(device)
-    data = {
-        'Bat': zip(pts.index,pts['BAT']),
-        'EC1adc1': zip(pts.index,pts['EC1-ADC1']),        
-        'EC1adc2': zip(pts.index,pts['EC1-ADC2']),
-        'EC1temp': zip(pts.index,pts['EC1-TEMP']),
-        'EC2adc1': zip(pts.index,pts['EC2-ADC1']),        
-        'EC2adc2': zip(pts.index,pts['EC2-ADC2']),
-        'EC2temp': zip(pts.index,pts['EC2-TEMP']),
-        'Luchtdruk': zip(pts.index,pts['PRES0-ADC']),
-        'Waterdruk': zip(pts.index,pts['PRES3-ADC']),
-        }
-            
-    return HttpResponse(json.dumps(data, ignore_nan = True, default=lambda x: time.mktime(x.timetuple())*1000.0), content_type='application/json')
+    try:
+        start, stop, max_points, method = chart_query(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    pts = util.get_raw_data(device, start, stop)
+    return series_as_json(pts, {
+        'Bat': 'BAT',
+        'EC1adc1': 'EC1-ADC1',
+        'EC1adc2': 'EC1-ADC2',
+        'EC1temp': 'EC1-TEMP',
+        'EC2adc1': 'EC2-ADC1',
+        'EC2adc2': 'EC2-ADC2',
+        'EC2temp': 'EC2-TEMP',
+        'Luchtdruk': 'PRES0-ADC',
+        'Waterdruk': 'PRES3-ADC',
+        }, max_points, method)
 
 @gzip_page
 def data_as_csv(request, pk):
@@ -313,7 +375,7 @@ class PeilView(LoginRequiredMixin, NavDetailView):
                         ]
                    }
 
-        context['options1'] = json.dumps(options,default=lambda x: time.mktime(x.timetuple())*1000.0)
+        context['options1'] = json.dumps(options,default=epoch_ms)
 
         options.update({
             'title': {'text': 'Ruwe sensor waardes'},
@@ -331,7 +393,7 @@ class PeilView(LoginRequiredMixin, NavDetailView):
                        {'name': 'Waterdruk', 'id': 'Waterdruk', 'yAxis': 0, 'data': []},
                        ]
                    })
-        context['options2'] = json.dumps(options,default=lambda x: time.mktime(x.timetuple())*1000.0)
+        context['options2'] = json.dumps(options,default=epoch_ms)
         return context
     
 class PostView(StaffRequiredMixin,NavDetailView):
@@ -382,6 +444,6 @@ class PostView(StaffRequiredMixin,NavDetailView):
         except Exception as e:
             survey = None
             
-        context['options'] = json.dumps(options,default=lambda x: time.mktime(x.timetuple())*1000.0)
+        context['options'] = json.dumps(options,default=epoch_ms)
         return context
     
\ No newline at end of file